@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+
+# Copyright 2018 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Benchmark suite of parsers and exporters, it records throughput and peak memory (traced Python allocations)
+    of every operation on synthetic inputs and compares them with stored baseline.
+
+    $ python benchmarks/suite.py --sizes 4K 1M 64M --save baseline.json
+    $ python benchmarks/suite.py --sizes 4K 1M 64M --compare baseline.json --threshold 0.2
+
+    The parallel benchmarks (CRC32, scan_file, MultiImage, ...) are measured for every worker count:
+
+    $ python benchmarks/suite.py --sizes 1G --filter scan_file --workers 1 2 4 8
+
+    The exit code is 1 if any result is slower or uses more memory than baseline by more than threshold
+    (the differences below TIME_NOISE and MEMORY_NOISE are ignored).
+"""
+
+import os
+import sys
+import json
+import shutil
+import timeit
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import uboot
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+# Default input sizes
+SIZES = ('4K', '64K', '1M', '16M', '256M', '1G')
+
+# The memory difference ignored by comparison (allocations of interpreter, etc.)
+MEMORY_NOISE = 64 * KB
+
+# The time difference of one call in seconds ignored by comparison (jitter of microsecond runs on small inputs)
+TIME_NOISE = 0.5e-3
+
+# The list of registered benchmarks: (name, setup function, max input size, parallel)
+BENCHMARKS = []
+
+
+def benchmark(name, max_size=None, parallel=False):
+    """ Register the benchmark, the decorated function gets input size and working directory (and the number
+        of workers if the benchmark is parallel) and returns the measured function without arguments
+    """
+    def decorator(func):
+        BENCHMARKS.append((name, func, max_size, parallel))
+        return func
+    return decorator
+
+
+def payload(size):
+    """ Get the synthetic image data of <size> bytes (random 1 MB block repeated) """
+    block = os.urandom(min(size, MB))
+    return (block * (size // len(block) + 1))[:size]
+
+
+def env_vars(size):
+    """ Get the list of environment variables with total size of about <size> bytes """
+    return [("var{0:07d}".format(n), "value_{0:021d}".format(n)) for n in range(max(size // 40, 1))]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Benchmarks
+# ----------------------------------------------------------------------------------------------------------------------
+@benchmark('parse_img')
+def bench_parse_img(size, workdir):
+    raw = uboot.StdImage(payload(size), name="Benchmark Image").export()
+    return lambda: uboot.parse_img(raw)
+
+
+@benchmark('StdImage.export')
+def bench_std_export(size, workdir):
+    img = uboot.StdImage(payload(size), name="Benchmark Image")
+
+    def func():
+        # drop the cached CRC and exported data
+        img.invalidate()
+        img.export()
+    return func
+
+
+@benchmark('CRC32', parallel=True)
+def bench_crc32(size, workdir, workers):
+    from uboot.old_image import CRC32
+    data = payload(size)
+    return lambda: CRC32(data, workers=workers)
+
+
+@benchmark('scan_file', parallel=True)
+def bench_scan_file(size, workdir, workers):
+    # The dump of random data with an image on every 1 MB
+    img = uboot.StdImage(payload(max(min(size // 4, 64 * KB), 1)), name="Benchmark Image").export()
+    dump = bytearray(payload(size))
+    for offset in range(0, size - len(img) + 1, max(MB, len(img))):
+        dump[offset:offset + len(img)] = img
+    path = os.path.join(workdir, 'scan.dump')
+    with open(path, 'wb') as f:
+        f.write(dump)
+    del dump
+    return lambda: uboot.scan_file(path, workers=workers)
+
+
+@benchmark('parse_img[multi]', parallel=True)
+def bench_parse_multi(size, workdir, workers):
+    mimg = uboot.MultiImage([uboot.StdImage(payload(size // 16), name="Image %d" % n) for n in range(16)])
+    raw = mimg.export()
+    return lambda: uboot.parse_img(raw, workers=workers if workers > 1 else None)
+
+
+@benchmark('MultiImage.export', parallel=True)
+def bench_multi_export(size, workdir, workers):
+    mimg = uboot.MultiImage([uboot.StdImage(payload(size // 16), name="Image %d" % n) for n in range(16)])
+
+    def func():
+        # drop the cached CRCs, so the images are hashed again
+        for img in mimg:
+            img.invalidate()
+        mimg.invalidate()
+        mimg.export(workers=workers if workers > 1 else None)
+    return func
+
+
+def _fit_image(size):
+    import fdt
+    fit = uboot.FdtImage()
+    fit.description = "Benchmark FIT Image"
+    node = fdt.Node("kernel@1")
+    node.append(fdt.PropStrings("type", "kernel"))
+    node.append(fdt.PropStrings("compression", "none"))
+    fit.add_img(node, payload(size))
+    return fit
+
+
+@benchmark('FdtImage.to_itb', max_size=256 * MB)
+def bench_to_itb(size, workdir):
+    fit = _fit_image(size)
+    return lambda: fit.to_itb()
+
+
+@benchmark('parse_itb', max_size=16 * MB)
+def bench_parse_itb(size, workdir):
+    raw = _fit_image(size).to_itb()
+    return lambda: uboot.parse_itb(raw)
+
+
+@benchmark('parse_itb[native]')
+def bench_parse_itb_native(size, workdir):
+    raw = _fit_image(size).to_itb(padding=4096)
+    return lambda: uboot.parse_itb(raw, native=True)
+
+
+@benchmark('FdtImage.verify_hashes', parallel=True)
+def bench_verify_hashes(size, workdir, workers):
+    import fdt
+    fit = uboot.FdtImage()
+    fit.description = "Benchmark FIT Image"
+    # The data are split into 20 images with sha256 hash node, they are hashed in parallel threads
+    for n in range(20):
+        node = fdt.Node("image@{}".format(n + 1))
+        node.append(fdt.PropStrings("type", "firmware"))
+        node.append(fdt.PropStrings("compression", "none"))
+        node.append(fdt.Node("hash@1", props=[fdt.PropStrings("algo", "sha256")]))
+        fit.add_img(node, payload(max(size // 20, 1)))
+    itb = uboot.parse_itb(fit.to_itb(padding=4096), native=True)
+    return lambda: itb.verify_hashes(workers)
+
+
+@benchmark('EnvBlob.export', max_size=64 * MB)
+def bench_env_export(size, workdir):
+    env = uboot.EnvBlob(size=size * 2)
+    for key, value in env_vars(size):
+        env.set(key, value)
+    return lambda: env.export()
+
+
+@benchmark('EnvBlob.parse', max_size=64 * MB)
+def bench_env_parse(size, workdir):
+    env = uboot.EnvBlob(size=size * 2)
+    for key, value in env_vars(size):
+        env.set(key, value)
+    raw = env.export()
+    return lambda: uboot.EnvBlob.parse(raw)
+
+
+@benchmark('EnvImgOld.open_img')
+def bench_env_open_img(size, workdir):
+    mark = "bootdelay="
+    env = "\0".join("{}={}".format(key, value) for key, value in env_vars(4 * KB)).encode()
+    env = (mark + "3\0").encode() + env + b"\0\0"
+    data = payload(size).replace(b'\0', b'\1')
+    path = os.path.join(workdir, 'env_{}.img'.format(size))
+    with open(path, 'wb') as f:
+        # the environment is placed in the middle of image
+        f.write(data[:size // 2])
+        f.write(env)
+        f.write(data[size // 2:])
+
+    def func():
+        img = uboot.EnvImgOld(mark)
+        img.open_img(path)
+    return func
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------------------------------------------------------
+def parse_size(text):
+    """ Convert the size string (4K, 1M, 1G) into bytes """
+    units = {'K': KB, 'M': MB, 'G': GB}
+    text = text.upper()
+    if text[-1] in units:
+        return int(text[:-1]) * units[text[-1]]
+    return int(text)
+
+
+def size_str(size):
+    for unit, value in (('G', GB), ('M', MB), ('K', KB)):
+        if size >= value and size % value == 0:
+            return "{}{}".format(size // value, unit)
+    return str(size)
+
+
+def measure(func, size, repeat):
+    """ Measure the best time and peak memory of one call """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat, number)) / number
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'time': best, 'speed': size / best / MB, 'peak': peak}
+
+
+def compare(result, base, threshold):
+    """ Get the list of regressions of result against baseline """
+    issues = []
+    if result['speed'] < base['speed'] * (1 - threshold) and result['time'] - base['time'] > TIME_NOISE:
+        issues.append("speed -{:.0%}".format(1 - result['speed'] / base['speed']))
+    if result['peak'] > base['peak'] * (1 + threshold) and result['peak'] - base['peak'] > MEMORY_NOISE:
+        issues.append("memory +{:.0%}".format(result['peak'] / max(base['peak'], 1) - 1))
+    return issues
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='*', default=SIZES, help="Input sizes (default: %s)" % " ".join(SIZES))
+    parser.add_argument('--filter', default='', help="Run only benchmarks containing this string")
+    parser.add_argument('--repeat', type=int, default=3, help="The number of measurements (default: 3)")
+    parser.add_argument('--save', metavar='FILE', help="Save the results as baseline into JSON file")
+    parser.add_argument('--compare', metavar='FILE', help="Compare the results with baseline from JSON file")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed regression (default: 0.2 = 20%%)")
+    parser.add_argument('--workers', type=int, nargs='*', default=[1],
+                        help="Worker counts of parallel benchmarks, 0 for CPU count (default: 1)")
+    args = parser.parse_args()
+    workers = [n or os.cpu_count() or 1 for n in args.workers]
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    results, regressions = {}, 0
+    workdir = tempfile.mkdtemp(prefix='uboot_bench_')
+    try:
+        print(" {0:<26s} {1:>6s} {2:>12s} {3:>10s} {4:>10s}  {5:s}".format(
+            "Benchmark", "Size", "Time [ms]", "MB/s", "Peak [MB]", "Baseline"))
+        for name, setup, max_size, parallel in BENCHMARKS:
+            if args.filter not in name:
+                continue
+            for size in sorted(parse_size(item) for item in args.sizes):
+                if max_size is not None and size > max_size:
+                    continue
+                for count in (workers if parallel else [None]):
+                    label = name if count is None else "{}[w{}]".format(name, count)
+                    key = "{}/{}".format(label, size_str(size))
+                    func = setup(size, workdir) if count is None else setup(size, workdir, count)
+                    result = measure(func, size, args.repeat)
+                    results[key] = result
+
+                    note = ""
+                    if key in baseline:
+                        issues = compare(result, baseline[key], args.threshold)
+                        regressions += bool(issues)
+                        note = "REGRESSION: " + ", ".join(issues) if issues else "OK"
+                    print(" {0:<26s} {1:>6s} {2:>12.3f} {3:>10.1f} {4:>10.2f}  {5:s}".format(
+                        label, size_str(size), result['time'] * 1000, result['speed'], result['peak'] / MB, note))
+    finally:
+        shutil.rmtree(workdir)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'machine': platform.machine(),
+                       'uboot': uboot.__version__,
+                       'results': results}, f, indent=2, sort_keys=True)
+
+    if regressions:
+        print("\n Regressions: %d (threshold: %.0f%%)" % (regressions, args.threshold * 100))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -22,9 +22,13 @@ TEMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
 
 # Test Files
 UBOOT_ITS = os.path.join(DATA_DIR, 'u-boot.its')
+UBOOT_BIN = os.path.join(DATA_DIR, 'u-boot.bin')
 SCRIPT_TXT = os.path.join(DATA_DIR, 'script.txt')
 UBOOT_ITB_TEMP = os.path.join(TEMP_DIR, 'u-boot.itb')
 SCRIPT_BIN_TEMP = os.path.join(TEMP_DIR, 'script.bin')
+UBOOT_IMG_TEMP = os.path.join(TEMP_DIR, 'u-boot.img')
+UBOOT_GZ_TEMP = os.path.join(TEMP_DIR, 'u-boot.gz.img')
+UBOOT_AUTO_TEMP = os.path.join(TEMP_DIR, 'u-boot.auto.img')
 
 
 def setup_module(module):
@@ -43,31 +47,126 @@ def test_mkimg_create(script_runner):
     assert ret.success
 
 
+@pytest.mark.script_launch_mode('subprocess')
+def test_mkimg_create_firmware(script_runner):
+    ret = script_runner.run('mkimg', 'create', '-i', 'firmware', '-l', '0x40200000', UBOOT_IMG_TEMP, UBOOT_BIN)
+    assert ret.success
+
+
 @pytest.mark.script_launch_mode('subprocess')
 def test_mkimg_info(script_runner):
     ret = script_runner.run('mkimg', 'info', SCRIPT_BIN_TEMP)
     assert ret.success
 
 
+@pytest.mark.script_launch_mode('subprocess')
+def test_mkimg_patch(script_runner):
+    ret = script_runner.run('mkimg', 'patch', '-l', '0x40800000', '-n', 'Patched U-Boot', '-t',
+                            '-d', '0x10', SCRIPT_TXT, UBOOT_IMG_TEMP)
+    assert ret.success
+    ret = script_runner.run('mkimg', 'info', UBOOT_IMG_TEMP)
+    assert ret.success
+    assert 'Patched U-Boot' in ret.stdout
+
+
+@pytest.mark.script_launch_mode('subprocess')
+def test_mkimg_scan(script_runner):
+    ret = script_runner.run('mkimg', 'scan', SCRIPT_BIN_TEMP)
+    assert ret.success
+
+
 @pytest.mark.script_launch_mode('subprocess')
 def test_mkimg_extract(script_runner):
     ret = script_runner.run('mkimg', 'extract', SCRIPT_BIN_TEMP)
     assert ret.success
 
 
+@pytest.mark.script_launch_mode('subprocess')
+def test_mkimg_extract_compressed(script_runner):
+    ret = script_runner.run('mkimg', 'create', '-c', 'gzip', '-j', '2', UBOOT_GZ_TEMP, UBOOT_BIN)
+    assert ret.success
+    ret = script_runner.run('mkimg', 'extract', UBOOT_GZ_TEMP)
+    assert ret.success
+    with open(UBOOT_BIN, 'rb') as f1, open(os.path.join(UBOOT_GZ_TEMP + '.ex', 'image.bin'), 'rb') as f2:
+        assert f1.read() == f2.read()
+
+
+@pytest.mark.script_launch_mode('subprocess')
+def test_mkimg_extract_unsupported(script_runner):
+    lzo_img = os.path.join(TEMP_DIR, 'u-boot.lzo.img')
+    ret = script_runner.run('mkimg', 'create', '-c', 'lzo', '-p', lzo_img, UBOOT_BIN)
+    assert ret.success
+    # the data without codec are extracted as they are
+    ret = script_runner.run('mkimg', 'extract', lzo_img)
+    assert ret.success
+    with open(UBOOT_BIN, 'rb') as f1, open(os.path.join(lzo_img + '.ex', 'image.lzo'), 'rb') as f2:
+        assert f1.read() == f2.read()
+
+
+@pytest.mark.script_launch_mode('subprocess')
+def test_mkimg_create_auto(script_runner):
+    ret = script_runner.run('mkimg', 'create', '-c', 'auto', '--policy', 'speed', UBOOT_AUTO_TEMP, UBOOT_BIN)
+    assert ret.success
+    assert 'Selected' in ret.stdout
+
+
 @pytest.mark.script_launch_mode('subprocess')
 def test_mkimg_create_itb(script_runner):
     ret = script_runner.run('mkimg', 'createitb', '-o', UBOOT_ITB_TEMP, UBOOT_ITS)
     assert ret.success
 
 
+@pytest.mark.script_launch_mode('subprocess')
+def test_mkimg_create_itb_external(script_runner):
+    itb_file = os.path.join(TEMP_DIR, 'u-boot.ext.itb')
+    ret = script_runner.run('mkimg', 'createitb', '-E', '-j', '2', '-o', itb_file, UBOOT_ITS)
+    assert ret.success
+    ret = script_runner.run('mkimg', 'infoitb', itb_file)
+    assert ret.success
+
+
 @pytest.mark.script_launch_mode('subprocess')
 def test_mkimg_info_itb(script_runner):
     ret = script_runner.run('mkimg', 'infoitb', UBOOT_ITB_TEMP)
     assert ret.success
 
 
+@pytest.mark.script_launch_mode('subprocess')
+def test_mkimg_verify_itb(script_runner):
+    ret = script_runner.run('mkimg', 'verifyitb', '-j', '2', UBOOT_ITB_TEMP)
+    assert ret.success
+    assert 'BAD' not in ret.stdout
+
+
 @pytest.mark.script_launch_mode('subprocess')
 def test_mkimg_extract_itb(script_runner):
     ret = script_runner.run('mkimg', 'extractitb', UBOOT_ITB_TEMP)
     assert ret.success
+
+
+@pytest.mark.script_launch_mode('subprocess')
+def test_mkimg_profile(script_runner):
+    profile_json = os.path.join(TEMP_DIR, 'profile.json')
+    ret = script_runner.run('mkimg', '--profile', '--profile-json', profile_json, 'info', UBOOT_IMG_TEMP)
+    assert ret.success
+    assert 'Profile' in ret.stdout
+    assert os.path.isfile(profile_json)
+
+
+@pytest.mark.script_launch_mode('subprocess')
+def test_mkimg_max_memory(script_runner):
+    ret = script_runner.run('mkimg', '--max-memory', '64K', 'create', '-c', 'auto', UBOOT_AUTO_TEMP, UBOOT_BIN)
+    assert ret.success
+    ret = script_runner.run('mkimg', '--max-memory', '64K', 'extract', UBOOT_AUTO_TEMP)
+    assert ret.success
+    with open(UBOOT_BIN, 'rb') as f1, open(os.path.join(UBOOT_AUTO_TEMP + '.ex', 'image.bin'), 'rb') as f2:
+        assert f1.read() == f2.read()
+    ret = script_runner.run('mkimg', '--profile', '--max-memory', '64K', 'createitb', '-o', UBOOT_ITB_TEMP + '.max',
+                            UBOOT_ITS)
+    assert not ret.success
+    assert 'Memory' in ret.stdout
+    # the input files aren't read before the failure
+    assert '\n read ' not in ret.stdout
+    # only the FDT structure is walked over mapped file
+    ret = script_runner.run('mkimg', '--max-memory', '64K', 'infoitb', UBOOT_ITB_TEMP)
+    assert ret.success
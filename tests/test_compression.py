@@ -0,0 +1,109 @@
+# Copyright 2018 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import gzip
+import uboot
+import pytest
+from uboot.compression import get_codecs, _CODECS
+
+# Test Data
+DATA = os.urandom(200 * 1024) + bytes(1024 * 1024) + b'U-Boot' * 10000
+
+
+@pytest.mark.parametrize('comp_type', get_codecs())
+def test_01_round_trip(comp_type):
+    data = uboot.compress(DATA, comp_type)
+    assert uboot.decompress(data, comp_type) == DATA
+
+    # stream of small input chunks and limited size of output chunks
+    chunks = [data[i:i + 1000] for i in range(0, len(data), 1000)]
+    out = list(uboot.iter_decompress(iter(chunks), comp_type, chunk_size=64 * 1024))
+    assert max(len(chunk) for chunk in out) <= 64 * 1024
+    assert b''.join(out) == DATA
+
+
+def test_02_gzip_threads():
+    data = uboot.compress(DATA, uboot.EnumCompressionType.GZIP, threads=4)
+    # single GZIP member readable by any decompressor
+    assert gzip.decompress(data) == DATA
+    assert uboot.decompress(data, uboot.EnumCompressionType.GZIP) == DATA
+
+
+def test_03_concatenated_streams():
+    data = uboot.compress(DATA, uboot.EnumCompressionType.BZIP2)
+    assert uboot.decompress(data + data + bytes(16), uboot.EnumCompressionType.BZIP2) == DATA + DATA
+
+    with pytest.raises(Exception):
+        uboot.decompress(data[:-10], uboot.EnumCompressionType.BZIP2)
+
+
+def test_04_register_codec():
+    class Compressor(object):
+        def compress(self, data):
+            return bytes(b ^ 0xFF for b in data)
+
+        def flush(self):
+            return b''
+
+    class Decompressor(Compressor):
+        eof = True
+        unused_data = b''
+
+        def decompress(self, data, max_length=-1):
+            return self.compress(data)
+
+    with pytest.raises(Exception):
+        uboot.compress(DATA, uboot.EnumCompressionType.LZO)
+
+    uboot.register_codec(uboot.EnumCompressionType.LZO, lambda level: Compressor(), lambda: Decompressor(), 'lzo')
+    try:
+        data = uboot.compress(DATA[:1000], uboot.EnumCompressionType.LZO)
+        assert data != DATA[:1000]
+        assert uboot.decompress(data, uboot.EnumCompressionType.LZO) == DATA[:1000]
+    finally:
+        _CODECS.pop(uboot.EnumCompressionType.LZO)
+
+
+def test_05_select_codec():
+    report = uboot.select_codec(DATA, 'size', workers=1)
+    assert len(report.stats) == len(get_codecs())
+    assert report.comp_type != uboot.EnumCompressionType.NONE
+    assert len(report.data) == min(item.size for item in report.stats)
+    assert uboot.decompress(report.data, report.comp_type) == DATA
+    assert 'Selected' in report.info()
+
+    # with very fast boot media the uncompressed data are loaded faster
+    report = uboot.select_codec(DATA, 'speed', read_speed=1e15, workers=1)
+    assert report.comp_type == uboot.EnumCompressionType.NONE
+
+    # measured in process pool with custom policy
+    report = uboot.select_codec(DATA, lambda item: item.size if item.comp_type else 0, workers=2)
+    assert report.comp_type == uboot.EnumCompressionType.NONE
+    assert report.data == DATA
+
+
+def test_06_select_codec_over_memory_budget():
+    expected = uboot.select_codec(DATA, 'size', workers=1)
+
+    uboot.set_max_memory(len(DATA))
+    try:
+        # the data are measured as stream and the compressed data aren't kept
+        report = uboot.select_codec(DATA, 'size', workers=2)
+    finally:
+        uboot.set_max_memory(None)
+
+    assert report.data is None
+    assert report.comp_type == expected.comp_type
+    assert [item.size for item in report.stats] == [item.size for item in expected.stats]
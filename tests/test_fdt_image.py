@@ -13,8 +13,10 @@
 # limitations under the License.
 
 import os
+import fdt
+import mmap
 import pytest
-from uboot import parse_itb, parse_its, FdtImage
+from uboot import parse_itb, parse_itb_file, parse_its, walk_fdt, FdtImage, FileData, CopyCounter, Profile
 
 
 # Used Directories
@@ -23,6 +25,7 @@ TEMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
 
 # Test Files
 UBOOT_ITS = os.path.join(DATA_DIR, 'u-boot.its')
+IMX7D_DTB = os.path.join(DATA_DIR, 'imx7d-sdb.dtb')
 UBOOT_ITB_TEMP = os.path.join(TEMP_DIR, 'u-boot.itb')
 
 
@@ -38,4 +41,159 @@ def teardown_module(module):
 
 
 def test_01():
-    pass
\ No newline at end of file
+    pass
+
+
+@pytest.mark.parametrize('padding, workers', [(0, None), (0x1000, None), (0, 2)])
+def test_02_write_itb(padding, workers):
+    with open(UBOOT_ITS, 'r') as f:
+        text = f.read()
+    fit = parse_its(text, DATA_DIR)
+    lazy_fit = parse_its(text, DATA_DIR, lazy=True)
+    assert all(isinstance(data, FileData) for data in lazy_fit.img_data.values())
+
+    # the image data are streamed from input files
+    with CopyCounter() as counter:
+        size = lazy_fit.to_itb_file(UBOOT_ITB_TEMP, padding, workers=workers)
+    counter.check(max_copied=0)
+    assert size == os.path.getsize(UBOOT_ITB_TEMP)
+
+    with open(UBOOT_ITB_TEMP, 'rb') as f:
+        itb = parse_itb(f.read())
+    assert itb.description == fit.description
+    assert [img.name for img in itb.img_info] == [img.name for img in fit.img_info]
+    for name, data in fit.img_data.items():
+        assert bytes(itb.img_data[name]) == bytes(data)
+
+
+def test_03_itb_align_size():
+    with open(UBOOT_ITS, 'r') as f:
+        fit = parse_its(f.read(), DATA_DIR)
+
+    # the external data start on page boundary and the blob is padded to size
+    itb = fit.to_itb(0x1000, align=0x1000, size=0x100000)
+    assert len(itb) == 0x100000
+    fdt_obj = fdt.parse_dtb(itb)
+    for img in fit.img_info:
+        node = fdt_obj.get_node('images/' + img.name)
+        position, size = node.get_property('data-position')[0], node.get_property('data-size')[0]
+        assert position % 0x1000 == 0
+        assert itb[position:position + size] == bytes(fit.img_data[img.name])
+
+    with open(UBOOT_ITB_TEMP, 'wb') as f:
+        assert fit.write_itb(f, 0x1000, align=0x1000, size=0x100000) == len(itb)
+    with open(UBOOT_ITB_TEMP, 'rb') as f:
+        assert f.read() == itb
+
+    # the blob with embedded data is aligned
+    itb = fit.to_itb(align=0x1000)
+    assert len(itb) % 0x1000 == 0
+    itb = parse_itb(itb)
+    for name, data in fit.img_data.items():
+        assert itb.img_data[name] == data
+
+    with pytest.raises(Exception):
+        fit.to_itb(0x10)
+
+
+def test_04_parse_itb_file():
+    with open(UBOOT_ITS, 'r') as f:
+        fit = parse_its(f.read(), DATA_DIR)
+    fit.to_itb_file(UBOOT_ITB_TEMP, align=0x1000, size=0x1000000)
+
+    # only the FDT structure is read, the external data are views over mapped file
+    with Profile() as prof:
+        itb = parse_itb_file(UBOOT_ITB_TEMP)
+    assert prof.stages['read']['bytes'] < 0x1000
+    for name, data in fit.img_data.items():
+        assert isinstance(itb.img_data[name], memoryview)
+        assert itb.img_data[name] == data
+    assert itb.info()
+    del itb
+
+    # the external data of mapped file are views
+    with open(UBOOT_ITB_TEMP, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with CopyCounter() as counter:
+        itb = parse_itb(mm)
+    assert counter.copied < 0x1000
+    for name, data in fit.img_data.items():
+        assert isinstance(itb.img_data[name], memoryview)
+        assert itb.img_data[name] == data
+    del itb
+
+    # the blob at offset
+    with open(UBOOT_ITB_TEMP, 'rb') as f:
+        raw = f.read()
+    itb = parse_itb(b'\0' * 16 + raw, 16)
+    assert [itb.img_data[img.name] for img in itb.img_info] == [fit.img_data[img.name] for img in fit.img_info]
+
+
+def test_05_walk_fdt():
+    with open(IMX7D_DTB, 'rb') as f:
+        data = f.read()
+    fdt_obj = fdt.parse_dtb(data)
+
+    paths = []
+    for path, props in walk_fdt(b'\0' * 4 + data, 4):
+        node = fdt_obj.get_node(path) if path != '/' else fdt_obj.root_node
+        assert list(props) == [prop.name for prop in node.props]
+        for prop in node.props:
+            assert fdt.new_property(prop.name, bytes(props[prop.name])) == prop
+        paths.append(path)
+    assert paths[0] == '/'
+    assert len(paths) == len(set(paths))
+
+
+@pytest.mark.parametrize('padding', [0, 0x1000])
+def test_06_parse_itb_native(padding):
+    with open(UBOOT_ITS, 'r') as f:
+        fit = parse_its(f.read(), DATA_DIR)
+    data = fit.to_itb(padding)
+
+    itb = parse_itb(data)
+    # the data of images are views into input data
+    with CopyCounter() as counter:
+        native = parse_itb(data, native=True)
+    counter.check(max_copied=0)
+
+    assert native.info() == itb.info()
+    assert native.time_stamp == itb.time_stamp
+    assert native.def_config == itb.def_config
+    for name, value in itb.img_data.items():
+        assert isinstance(native.img_data[name], memoryview)
+        assert native.img_data[name] == value
+    assert native.to_itb(padding) == data
+
+    with open(UBOOT_ITB_TEMP, 'wb') as f:
+        f.write(data)
+    native = parse_itb_file(UBOOT_ITB_TEMP, native=True)
+    assert native.info() == itb.info()
+    del native
+
+
+@pytest.mark.parametrize('padding', [0, 0x1000])
+def test_07_hash_nodes(padding):
+    with open(UBOOT_ITS, 'r') as f:
+        fit = parse_its(f.read(), DATA_DIR, lazy=True)
+    fit.to_itb_file(UBOOT_ITB_TEMP, padding, workers=2)
+
+    # the values of hash nodes are calculated by export and verified from mapped file without copies
+    with CopyCounter() as counter:
+        itb = parse_itb_file(UBOOT_ITB_TEMP, native=True, verify=True)
+    counter.check(max_copied=0)
+    results = itb.verify_hashes(workers=4)
+    assert [(item.image, item.algo) for item in results] == \
+           [('uboot@1', 'crc32'), ('uboot@1', 'sha1'), ('fdt@1', 'sha256')]
+    assert all(item.valid for item in results)
+    assert fit.to_itb(padding) == parse_itb(fit.to_itb(padding), verify=True).to_itb(padding)
+    del itb
+
+    # the changed data are detected
+    with open(UBOOT_ITB_TEMP, 'rb') as f:
+        data = bytearray(f.read())
+    data[-1] ^= 0xFF
+    itb = parse_itb(data, native=True)
+    assert [item.valid for item in itb.verify_hashes()] == [True, True, False]
+    with pytest.raises(Exception):
+        parse_itb(data, verify=True)
@@ -147,3 +147,459 @@ def test_03_bad_crc():
     expected_data = bytes([1] * 64)
     assert img.data == expected_data, "Data wasn't correct"
 
+
+
+def test_04_zero_copy_parse():
+    fwimg = uboot.StdImage(bytes(range(256)) * 4, name="Zero-Copy Test Image", image=uboot.EnumImageType.FIRMWARE)
+    with open(UBOOT_IMG_TEMP, "wb") as f:
+        f.write(fwimg.export())
+
+    # --------------------------------------------------------------------------------
+    # parse image from memoryview, the data must be a view over the input buffer
+    # --------------------------------------------------------------------------------
+    with open(UBOOT_IMG_TEMP, "rb") as f:
+        data = f.read()
+
+    img = uboot.parse_img(memoryview(data))
+    assert isinstance(img.data, memoryview)
+    assert img.data.obj is data
+    assert img == fwimg
+
+    # --------------------------------------------------------------------------------
+    # parse image from file (mmap), the data are copied at first modification only
+    # --------------------------------------------------------------------------------
+    img = uboot.parse_img_file(UBOOT_IMG_TEMP)
+    assert isinstance(img.data, memoryview)
+    assert img.data.readonly
+    assert img == fwimg
+
+    img[0] = 0xFF
+    assert isinstance(img.data, bytearray)
+    assert img.data[0] == 0xFF
+    assert img.data[1:] == fwimg.data[1:]
+
+
+def test_05_scan_images():
+    fwimg = uboot.StdImage(bytes([2] * 100), name="Scan Firmware", image=uboot.EnumImageType.FIRMWARE)
+    mimg = uboot.MultiImage(name="Scan Multi")
+    mimg.append(uboot.StdImage(bytes([3] * 33), name="Scan Child"))
+
+    fw_data = fwimg.export()
+    bad_data = bytearray(fw_data)
+    bad_data[-1] ^= 0xFF
+    dump = bytes(13) + fw_data + bytes(7) + mimg.export() + bytes(bad_data) + bytes(5)
+
+    items = list(uboot.scan_images(dump))
+    assert [item.header.name for item in items] == ["Scan Firmware", "Scan Multi", "Scan Child", "Scan Firmware"]
+    assert items[0].offset == 13
+    assert all(item.header_crc_ok for item in items)
+    assert [item.data_crc_ok for item in items] == [True, True, True, False]
+
+    # the same result for memoryview input
+    assert [item.offset for item in uboot.scan_images(memoryview(dump))] == [item.offset for item in items]
+
+
+def test_06_scan_file_shards():
+    fwimg = uboot.StdImage(bytes([4] * 200), name="Shard Firmware", image=uboot.EnumImageType.FIRMWARE)
+    fw_data = fwimg.export()
+
+    # place the headers across every shard boundary (shard_size = 256)
+    dump = bytearray(4096)
+    for offset in (0, 230, 500, 1010, 1790, 2790):
+        dump[offset:offset + len(fw_data)] = fw_data
+    with open(UBOOT_IMG_TEMP, "wb") as f:
+        f.write(dump)
+
+    expected = [(item.offset, item.data_crc_ok) for item in uboot.scan_images(dump)]
+    assert [offset for offset, _ in expected] == [0, 230, 500, 1010, 1790, 2790]
+
+    for workers in (1, 2):
+        items = uboot.scan_file(UBOOT_IMG_TEMP, workers=workers, shard_size=256)
+        assert [(item.offset, item.data_crc_ok) for item in items] == expected
+
+
+def test_07_streaming_export():
+    fwimg = uboot.StdImage(bytes(range(256)) * 64, name="Streaming Test Image", image=uboot.EnumImageType.FIRMWARE)
+    raw_data = fwimg.export()
+
+    # --------------------------------------------------------------------------------
+    # the data streamed from file in small chunks
+    # --------------------------------------------------------------------------------
+    data_file = os.path.join(TEMP_DIR, 'data.bin')
+    with open(data_file, "wb") as f:
+        f.write(fwimg.data)
+
+    img = uboot.StdImage(uboot.FileData(data_file), name="Streaming Test Image", image=uboot.EnumImageType.FIRMWARE)
+    img.header.time_stamp = fwimg.header.time_stamp
+    img.save(UBOOT_IMG_TEMP, chunk_size=1000)
+    os.remove(data_file)
+
+    with open(UBOOT_IMG_TEMP, "rb") as f:
+        assert f.read() == raw_data
+
+    # --------------------------------------------------------------------------------
+    # the data streamed from iterator
+    # --------------------------------------------------------------------------------
+    chunks = (fwimg.data[i:i + 333] for i in range(0, len(fwimg.data), 333))
+    img = uboot.StdImage(chunks, name="Streaming Test Image", image=uboot.EnumImageType.FIRMWARE)
+    img.header.time_stamp = fwimg.header.time_stamp
+    img.save(UBOOT_IMG_TEMP)
+
+    assert uboot.parse_img_file(UBOOT_IMG_TEMP).export() == raw_data
+
+    # the streamed iterator is consumed, it can't be exported again
+    with pytest.raises(Exception):
+        img.export()
+
+    # --------------------------------------------------------------------------------
+    # the iterator read by info() is kept for export
+    # --------------------------------------------------------------------------------
+    chunks = (fwimg.data[i:i + 333] for i in range(0, len(fwimg.data), 333))
+    img = uboot.StdImage(chunks, name="Streaming Test Image", image=uboot.EnumImageType.FIRMWARE)
+    img.header.time_stamp = fwimg.header.time_stamp
+    assert img.info() == fwimg.info()
+    assert img.export() == raw_data
+    img.save(UBOOT_IMG_TEMP)
+
+    with open(UBOOT_IMG_TEMP, "rb") as f:
+        assert f.read() == raw_data
+
+
+def test_08_file_backed_multi_image():
+    payload = bytes(range(256)) * 16 + bytes(3)
+    data_file = os.path.join(TEMP_DIR, 'data.bin')
+    with open(data_file, "wb") as f:
+        f.write(bytes(100) + payload + bytes(100))
+
+    mimg = uboot.MultiImage(name="Multi-File Test Image")
+    mimg.append(uboot.StdImage(uboot.FileData(data_file, 100, len(payload)), name="File Child"))
+    mimg.append(uboot.StdImage(payload[:1001], name="Memory Child"))
+
+    mimg.save(UBOOT_IMG_TEMP, chunk_size=512)
+    os.remove(data_file)
+
+    with open(UBOOT_IMG_TEMP, "rb") as f:
+        data = f.read()
+
+    img = uboot.parse_img(data)
+    assert len(img) == 2
+    assert img[0].data == payload
+    assert img[1].data == payload[:1001]
+    assert data == img.export()
+
+
+def test_09_lazy_multi_image():
+    mimg = uboot.MultiImage(name="Lazy Multi Image")
+    for n in range(3):
+        mimg.append(uboot.StdImage(bytes([n + 1] * (100 + n)), name="Child %d" % n))
+    data = bytearray(mimg.export())
+
+    # corrupt the data of first child (behind multi image header, table of 3 lengths and child header)
+    data[64 + 4 * 4 + 64 + 1] ^= 0xFF
+
+    with pytest.raises(Exception):
+        uboot.parse_img(data)
+
+    img = uboot.parse_img(data, lazy=True)
+    assert len(img) == 3
+    assert img[2].header.name == "Child 2"
+    assert img[2].data == bytes([3] * 102)
+
+    with pytest.raises(Exception):
+        img[0]
+    assert [child.header.name for child in img[1:]] == ["Child 1", "Child 2"]
+
+    # the iteration doesn't check the data, the CRC of corrupted image fails at first access of data
+    img = uboot.parse_img(data, lazy=True)
+    with uboot.Profile() as prof:
+        assert [child.header.name for child in img] == ["Child 0", "Child 1", "Child 2"]
+    # only the headers are hashed
+    assert prof.stages['checksum']['bytes'] == 3 * 64
+    child = next(iter(img))
+    for access in (lambda: child.data, lambda: child[0], lambda: child.export(), lambda: img.export()):
+        with pytest.raises(Exception):
+            access()
+
+    # the corrupted image is popped without check
+    img = uboot.parse_img(data, lazy=True)
+    child = img.pop(0)
+    assert child.header.name == "Child 0"
+    assert len(img) == 2
+    with pytest.raises(Exception):
+        child.data
+
+    # the script images are lazy parsed in the same way
+    mimg = uboot.MultiImage(name="Lazy Multi Image")
+    mimg.append(uboot.ScriptImage([["echo", "'Child 0'"]], name="Script 0"))
+    mimg.append(uboot.ScriptImage([["echo", "'Child 1'"]], name="Script 1"))
+    data = bytearray(mimg.export())
+    # corrupt the text of first script (behind multi image header, table of 2 lengths, child header and length)
+    data[64 + 3 * 4 + 64 + 8 + 1] ^= 0x01
+
+    img = uboot.parse_img(data, lazy=True)
+    with uboot.Profile() as prof:
+        assert [child.header.name for child in img] == ["Script 0", "Script 1"]
+    assert prof.stages['checksum']['bytes'] == 2 * 64
+    assert img[1].cmds == [["echo", "'Child 1'"]]
+    child = img.pop(0)
+    for access in (lambda: child.cmds, lambda: child[0], lambda: child.store(), lambda: child.export()):
+        with pytest.raises(Exception):
+            access()
+
+
+def test_10_header_cache():
+    header = uboot.old_image.Header(name="Cached Header", laddr=0x1000)
+    raw = header.export()
+    assert header.export() is raw
+    assert header.header_crc == uboot.old_image.CRC32(raw[:4] + bytes(4) + raw[8:])
+
+    other = uboot.old_image.Header.parse(raw)
+    assert other == header
+
+    # setting the same value keeps the cache, a change drops it
+    header.load_address = 0x1000
+    assert header.export() is raw
+    header.load_address = 0x2000
+    assert header.export() != raw
+    assert other != header
+    assert uboot.old_image.Header.parse(header.export()).load_address == 0x2000
+
+
+def test_11_export_cache():
+    fwimg = uboot.StdImage(bytes(1000), name="Cached Image")
+    mimg = uboot.MultiImage(name="Cached Multi Image")
+    mimg.append(fwimg)
+
+    # info() updates the header without exporting the image
+    mimg.info()
+    assert mimg._export_cache is None and fwimg._export_cache is None
+    data_crc = mimg.header.data_crc
+
+    raw = mimg.export()
+    assert mimg.export() is raw
+    assert fwimg.export() is fwimg.export()
+
+    # a change of the child is propagated into multi image
+    fwimg[0] = 1
+    assert mimg.export() != raw
+    assert mimg.header.data_crc != data_crc
+    assert uboot.parse_img(mimg.export())[0].data[0] == 1
+
+    # a change of the header only
+    raw = fwimg.export()
+    fwimg.header.name = "Renamed Image"
+    assert fwimg.export() != raw
+    assert fwimg.export()[64:] == raw[64:]
+
+    # the data returned to caller can be modified in place, they aren't cached anymore
+    fwimg.data[1] = 2
+    assert uboot.parse_img(fwimg.export()).data[1] == 2
+    fwimg.data.extend(b'zz')
+    assert uboot.parse_img(fwimg.export()).header.data_size == 1002
+    assert uboot.parse_img(mimg.export())[0].header.data_size == 1002
+
+    # the bytearray passed by caller is shared
+    data = bytearray(100)
+    fwimg = uboot.StdImage(data)
+    raw = fwimg.export()
+    data[0] = 1
+    assert fwimg.export() != raw
+    assert uboot.parse_img(fwimg.export()).data[0] == 1
+
+
+def test_12_fingerprint():
+    images = []
+    for n in range(3):
+        mimg = uboot.MultiImage(name="Fingerprint Multi Image")
+        mimg.append(uboot.StdImage(bytes([5] * 300), name="Child"))
+        mimg.append(uboot.StdImage(bytes([n % 2] * 300), name="Child"))
+        mimg.header.time_stamp += n
+        images.append(mimg)
+
+    # time stamps are ignored, the content is compared
+    assert images[0] == images[2]
+    assert images[0] != images[1]
+    assert len({images[0], images[1], images[2]}) == 2
+
+    # parsed image has the same fingerprint without calculation of data CRC
+    img = uboot.parse_img(images[1].export())
+    assert img == images[1]
+    assert img in {images[0]: 0, images[1]: 1}
+
+    # stronger hash of data
+    try:
+        uboot.StdImage.FINGERPRINT_HASH = 'sha256'
+        assert images[0] == images[2]
+        assert images[0] != images[1]
+        _, (size, digest) = images[0][0].fingerprint()
+        assert size == 300 and len(digest) == 32
+    finally:
+        uboot.StdImage.FINGERPRINT_HASH = None
+
+
+def test_13_parallel_multi_image():
+    from concurrent.futures import ThreadPoolExecutor
+
+    mimg = uboot.MultiImage(name="Parallel Multi Image")
+    for n in range(8):
+        mimg.append(uboot.StdImage(bytes([n]) * (10000 + n), name="Child %d" % n))
+    raw = mimg.export(workers=4)
+
+    img = uboot.parse_img(raw, workers=4)
+    assert img == mimg
+    assert img.export() == raw
+
+    # shared executor
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        img = uboot.parse_img(raw, workers=executor)
+        img[3] = uboot.StdImage(bytes(100), name="Replaced")
+        assert uboot.parse_img(img.export(workers=executor), workers=executor)[3].header.name == "Replaced"
+
+    bad_raw = bytearray(raw)
+    bad_raw[-1] ^= 0xFF
+    with pytest.raises(Exception):
+        uboot.parse_img(bad_raw, workers=4)
+
+    # the images with shared mutable data (not cached) are hashed once per export and info
+    calls = []
+    mimg = uboot.MultiImage(name="Shared Multi Image")
+    for n in range(4):
+        child = uboot.StdImage(bytearray([n]) * 10000, name="Child %d" % n)
+        child._calc_crc = lambda calc=child._calc_crc: calls.append(1) or calc()
+        mimg.append(child)
+    raw = mimg.export(workers=4)
+    assert len(calls) == 4
+    mimg.info()
+    assert len(calls) == 8
+    assert uboot.parse_img(raw) == mimg
+
+
+def test_14_auto_compression():
+    data = b'U-Boot Image ' * 10000
+    img = uboot.new_img(data=data, image='kernel', compress='auto', workers=1)
+    assert img.header.compression != uboot.EnumCompressionType.NONE
+    assert img.compress_report.comp_type == img.header.compression
+    assert uboot.decompress(img.data, img.header.compression) == data
+
+    img = uboot.parse_img(img.export())
+    assert uboot.decompress(img.data, img.header.compression) == data
+
+    with pytest.raises(Exception):
+        uboot.new_img(image='script', compress='auto')
+
+
+def test_15_crc32_combine():
+    from uboot.old_image import CRC32, crc32_combine
+
+    data1, data2 = os.urandom(1000), os.urandom(12345)
+    assert crc32_combine(CRC32(data1), CRC32(data2), len(data2)) == CRC32(data1 + data2)
+    assert crc32_combine(CRC32(data1), CRC32(b''), 0) == CRC32(data1)
+
+    def no_rehash():
+        raise AssertionError("The data are hashed again")
+
+    # patch of image data updates the CRC from the patched range only
+    img = uboot.StdImage(os.urandom(1024 * 1024), name="Patched Image")
+    img.export()
+    img._calc_crc = no_rehash
+    img.patch(1000, b'Patched')
+    img[-1] = 0x55
+    img[10:12] = b'AB'
+    raw = img.export()
+    assert uboot.parse_img(raw).data == img[:]
+    with pytest.raises(Exception):
+        img.patch(len(img) - 1, b'Out')
+
+    # append into multi image hashes the new image only (the CRC of patched image is still cached)
+    mimg = uboot.MultiImage([img])
+    mimg.export()
+    mimg.append(uboot.StdImage(os.urandom(1000), name="Appended Image"))
+    mimg._iter_payload = no_rehash
+    mimg.info()
+    del mimg._iter_payload
+    assert uboot.parse_img(mimg.export()).header.data_crc == mimg.header.data_crc
+
+
+def test_16_parallel_crc32():
+    import zlib
+    from uboot import old_image
+
+    data = os.urandom(3 * 1024 * 1024 + 12345)
+    threshold, chunk_size = old_image.CRC32_PARALLEL_THRESHOLD, old_image.CRC32_CHUNK_SIZE
+    old_image.CRC32_PARALLEL_THRESHOLD, old_image.CRC32_CHUNK_SIZE = 1024 * 1024, 256 * 1024
+    try:
+        expected = zlib.crc32(data) & 0xFFFFFFFF
+        for workers in (1, 2, 3, 8):
+            assert old_image.CRC32(data, workers=workers) == expected
+            assert old_image.CRC32(memoryview(data), workers=workers) == expected
+            # continued CRC
+            assert old_image.CRC32(data[1000:], old_image.CRC32(data[:1000]), workers=workers) == expected
+        # below threshold
+        assert old_image.CRC32(data[:1000], workers=4) == zlib.crc32(data[:1000])
+
+        img = uboot.StdImage(data, name="Large Image")
+        assert uboot.parse_img(img.export()).header.data_crc == expected
+
+        # inside the task of other pool the data aren't split into another pool
+        get_executor, old_image.get_executor = old_image.get_executor, None
+        try:
+            assert uboot.common.pool_task(old_image.CRC32, data) == expected
+        finally:
+            old_image.get_executor = get_executor
+    finally:
+        old_image.CRC32_PARALLEL_THRESHOLD, old_image.CRC32_CHUNK_SIZE = threshold, chunk_size
+
+
+def test_17_patch_img_file():
+    data = bytearray(os.urandom(100000))
+    img = uboot.StdImage(bytes(data), name="Release Image", laddr=0x80000000)
+    img.save(UBOOT_IMG_TEMP)
+
+    header = uboot.patch_img_file(UBOOT_IMG_TEMP, laddr=0x80800000, eaddr=0x80800040, name="Patched Image",
+                                  patches=[(100, b'\x01\x02\x03'), (99997, b'END')])
+    data[100:103] = b'\x01\x02\x03'
+    data[99997:] = b'END'
+
+    img = uboot.parse_img_file(UBOOT_IMG_TEMP)
+    assert img.header == header
+    assert img.header.load_address == 0x80800000
+    assert img.header.entry_address == 0x80800040
+    assert img.header.name == "Patched Image"
+    assert bytes(img.data) == data
+    del img
+
+    with pytest.raises(Exception):
+        uboot.patch_img_file(UBOOT_IMG_TEMP, patches=[(99998, b'END')])
+
+
+def test_18_max_memory():
+    data = os.urandom(64 * 1024)
+    img = uboot.StdImage(data, name="Large Image")
+    raw = img.export()
+
+    uboot.set_max_memory(32 * 1024)
+    try:
+        # the image is streamed into file
+        img.save(UBOOT_IMG_TEMP)
+        img = uboot.parse_img_file(UBOOT_IMG_TEMP)
+        assert img.data == data
+        del img
+
+        # the data are compressed on the fly by selected codec
+        img = uboot.new_img(data=uboot.FileData(UBOOT_IMG_TEMP, 64), compress='auto', workers=1)
+        assert img.compress_report.data is None
+        img.save(UBOOT_IMG_TEMP + '.auto')
+        img = uboot.parse_img_file(UBOOT_IMG_TEMP + '.auto')
+        assert uboot.decompress(img.data, img.header.compression) == data
+        del img
+
+        # the export into memory fails before anything is copied
+        with pytest.raises(Exception, match='Memory'):
+            uboot.StdImage(data).export()
+        with pytest.raises(Exception, match='Memory'):
+            uboot.parse_img(raw)
+        # the view isn't copied
+        assert uboot.parse_img(memoryview(raw)).data == data
+    finally:
+        uboot.set_max_memory(None)
+        os.remove(UBOOT_IMG_TEMP + '.auto')
@@ -0,0 +1,82 @@
+# Copyright 2018 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import uboot
+import pytest
+
+# Used Directories
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Test Files
+UBOOT_ITS = os.path.join(DATA_DIR, 'u-boot.its')
+IMX7D_DTB = os.path.join(DATA_DIR, 'imx7d-sdb.dtb')
+
+
+def test_01_old_image():
+    img = uboot.StdImage(bytes(range(256)) * 4, name="Blob Image")
+    raw = bytes(16) + img.export()
+
+    obj, fmt = uboot.parse_blob(raw, 16)
+    assert fmt == 'img'
+    assert obj == img
+    # the data are a view of input data
+    assert isinstance(obj.data, memoryview) and obj.data.obj is raw
+
+    # the header at offset is parsed only (no search for the next image)
+    with pytest.raises(Exception):
+        uboot.parse_blob(raw[:20] + b'\0' + raw[21:], 16)
+
+
+def test_02_fdt():
+    with open(UBOOT_ITS, 'r') as f:
+        fit = uboot.parse_its(f.read(), DATA_DIR)
+
+    obj, fmt = uboot.parse_blob(fit.to_itb())
+    assert fmt == 'itb'
+    assert obj.description == fit.description
+    assert [obj.img_data[img.name] for img in obj.img_info] == [fit.img_data[img.name] for img in fit.img_info]
+
+    # the external data are sliced from input data
+    obj, fmt = uboot.parse_blob(fit.to_itb(padding=0x1000))
+    assert fmt == 'itb'
+    assert [obj.img_data[img.name] for img in obj.img_info] == [fit.img_data[img.name] for img in fit.img_info]
+
+    with open(IMX7D_DTB, 'rb') as f:
+        obj, fmt = uboot.parse_blob(f.read())
+    assert fmt == 'dtb'
+
+
+@pytest.mark.parametrize('bigendian', [False, True])
+@pytest.mark.parametrize('redundant', [False, True])
+def test_03_env(bigendian, redundant):
+    env = uboot.EnvBlob(size=1024, redundant=redundant, bigendian=bigendian)
+    env.set("bootdelay", "3")
+    env.set("bootcmd", "run netboot")
+
+    obj, fmt = uboot.parse_blob(env.export())
+    assert fmt == 'env'
+    assert obj.get("bootcmd") == "run netboot"
+    assert obj.bigendian == bigendian
+    assert obj.redundant == redundant
+
+
+def test_04_unknown():
+    with pytest.raises(Exception):
+        uboot.parse_blob(bytes(100))
+
+    # truncated header of old image
+    magic = uboot.old_image.Header.MAGIC_NUMBER.to_bytes(4, 'big')
+    with pytest.raises(Exception, match='parse_blob: Too small'):
+        uboot.parse_blob(magic + bytes(12))
@@ -0,0 +1,96 @@
+# Copyright 2018 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import json
+import uboot
+import pytest
+
+
+def test_01_nested_spans():
+    records = []
+
+    def sink(stage, elapsed, size):
+        records.append((stage, elapsed, size))
+
+    uboot.add_sink(sink)
+    try:
+        with uboot.span('serialize', 100):
+            time.sleep(0.01)
+            with uboot.span('write', 10):
+                time.sleep(0.05)
+    finally:
+        uboot.remove_sink(sink)
+
+    # the inner span is reported first and the outer one reports its own time only
+    assert [(stage, size) for stage, _, size in records] == [('write', 10), ('serialize', 100)]
+    assert records[0][1] >= 0.05
+    assert records[1][1] < 0.05
+
+    # without sinks nothing is measured
+    with uboot.span('write', 10):
+        pass
+    assert len(records) == 2
+
+
+def test_02_profile(tmpdir):
+    data = os.urandom(64 * 1024)
+
+    with uboot.Profile() as prof:
+        img = uboot.parse_img(uboot.StdImage(data, name="Test Image").export())
+        assert img.data == data
+
+    assert {'serialize', 'checksum', 'parse'} <= set(prof.stages)
+    assert prof.stages['checksum']['bytes'] >= 2 * len(data)
+    assert 'Total' in prof.info()
+
+    file = str(tmpdir.join('profile.json'))
+    prof.save(file)
+    with open(file) as f:
+        assert json.load(f)['stages']['parse']['calls'] == 1
+
+    # the profile is stopped
+    uboot.StdImage(data).export()
+    assert prof.stages['serialize']['calls'] == 1
+
+
+def test_03_copy_budget(tmpdir):
+    data = os.urandom(1024 * 1024) * 16
+    raw = uboot.StdImage(data, name="Test Image").export()
+    file = str(tmpdir.join('test.img'))
+    with open(file, 'wb') as f:
+        f.write(raw)
+
+    # the data of parsed image are views into input data or mapped file
+    with uboot.CopyCounter() as counter:
+        uboot.parse_img(memoryview(raw))
+        img = uboot.parse_img_file(file)
+        assert img.data == data
+        del img
+    counter.check(max_copied=0)
+
+    mimg = uboot.MultiImage([uboot.StdImage(data[:1000], name="Image 1"), uboot.StdImage(data, name="Image 2")])
+    raw = mimg.export()
+    with uboot.CopyCounter() as counter:
+        uboot.parse_img(memoryview(raw))
+    counter.check(max_copied=0)
+
+    # the slicing of bytes is counted
+    with uboot.CopyCounter() as counter:
+        uboot.parse_img(raw)
+        with pytest.raises(Exception):
+            counter.check(max_copied=0)
+    assert counter.copied >= len(data)
+    assert 'get_slice' in counter.info()
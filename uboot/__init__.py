@@ -12,9 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .common import EnumArchType, EnumOsType, EnumImageType, EnumCompressionType
-from .old_image import StdImage, FwImage, ScriptImage, MultiImage, get_img_type, new_img, parse_img
-from .fdt_image import FdtImage, parse_its, parse_itb
+import fdt
+import binascii
+from struct import unpack_from
+
+from .tracing import Profile, CopyCounter, span, traced, add_sink, remove_sink, count_copy
+from .common import EnumArchType, EnumOsType, EnumImageType, EnumCompressionType, FileData, CHUNK_SIZE, \
+                    set_max_memory, get_max_memory, check_memory
+from .old_image import StdImage, FwImage, ScriptImage, MultiImage, get_img_type, new_img, parse_img, \
+                       parse_img_file, patch_img_file, scan_images, scan_file, Header, parse_img_at
+from .compression import register_codec, compress, decompress, iter_compress, iter_decompress, select_codec
+from .fdt_image import FdtImage, parse_its, parse_itb, parse_itb_file, parse_fit, walk_fdt, FDT_MAGIC
 from .env_image import EnvImgOld
 from .env_blob import EnvBlob
 
@@ -26,9 +34,12 @@ __license__ = "Apache 2.0"
 __status__  = "Development"
 __all__ = [
     # Classes
+    'FileData',
     'EnvBlob',
     'EnvImgOld',
     'FdtImage',
+    'Profile',
+    'CopyCounter',
     'StdImage',
     'FwImage',
     'ScriptImage',
@@ -38,20 +49,73 @@ __all__ = [
     'EnumArchType',
     'EnumImageType',
     'EnumCompressionType',
+    # Constants
+    'CHUNK_SIZE',
     # Methods
     'get_img_type',
     'new_img',
     'parse_img',
+    'parse_img_file',
+    'parse_img_at',
+    'patch_img_file',
+    'scan_images',
+    'scan_file',
+    'register_codec',
+    'compress',
+    'decompress',
+    'iter_compress',
+    'iter_decompress',
+    'select_codec',
     'parse_its',
-    'parse_itb'
+    'parse_itb',
+    'parse_itb_file',
+    'walk_fdt',
+    'parse_blob',
+    'set_max_memory',
+    'get_max_memory',
+    'check_memory',
+    'span',
+    'traced',
+    'add_sink',
+    'remove_sink'
 ]
 
 
 def parse_blob(data, offset=0):
-    """ Universal parser for binary blob
+    """ Universal parser for binary blob, the format is detected from the magic word (or CRC) at offset only once
+        and the data are passed to the right parser as a view, so the image data are not copied.
 
-    :param data:
-    :param offset:
-    :return:
+    :param data: The data as bytes, bytearray, memoryview or mmap
+    :param offset: The offset of blob inside data
+    :return: Tuple of parsed object and detected format: 'img' (old image), 'itb' (FIT image), 'dtb' (device tree
+             without images) or 'env' (environment blob)
     """
-    raise NotImplementedError()
+    view = memoryview(data).cast('B')
+    if len(view) - offset < 8:
+        raise Exception("parse_blob: Too small size of input data !")
+
+    (magic,) = unpack_from('>L', view, offset)
+
+    if magic == Header.MAGIC_NUMBER:
+        if len(view) - offset < Header.SIZE:
+            raise Exception("parse_blob: Too small size of input data !")
+        # The header at offset is parsed, don't search for the next one
+        return parse_img_at(view, offset), 'img'
+
+    if magic == FDT_MAGIC:
+        # Only the device tree structure is copied, the external data of FIT images are sliced from view
+        (fdt_size,) = unpack_from('>L', view, offset + 4)
+        count_copy('parse_blob', fdt_size)
+        fdt_obj = fdt.parse_dtb(bytes(view[offset:offset + fdt_size]))
+        if fdt_obj.exist_node('images'):
+            return parse_fit(fdt_obj, view, offset), 'itb'
+        return fdt_obj, 'dtb'
+
+    # Environment blob: CRC (little or big endian) of data behind it, with flag byte if redundant
+    start = offset + (5 if view[offset + 4] == 0x01 else 4)
+    crc = binascii.crc32(view[start:]) & 0xFFFFFFFF
+    for bigendian in (False, True):
+        if unpack_from('>L' if bigendian else '<L', view, offset)[0] == crc:
+            return EnvBlob.parse(view, offset, bigendian, ignore_crc=True), 'env'
+
+    raise Exception("parse_blob: Unknown data format !")
@@ -0,0 +1,76 @@
+# Copyright 2018 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import click
+import uboot
+
+
+# User defined class
+class MemSize(click.ParamType):
+    """ Custom argument type for memory size with optional K, M or G suffix """
+    name = 'size'
+
+    def __repr__(self):
+        return 'SIZE'
+
+    def convert(self, value, param, ctx):
+        try:
+            if isinstance(value, (int,)):
+                return value
+            units = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+            text = value.strip().upper()
+            if text[-1] in units:
+                size = int(float(text[:-1]) * units[text[-1]])
+            else:
+                size = int(text, 0)
+            assert size > 0
+            return size
+        except:
+            self.fail('%s is not a valid size' % value, param, ctx)
+
+
+# Create instances of custom argument types
+MEMSIZE = MemSize()
+
+
+def common_options(func):
+    """ Decorator adding the options shared by all tools: --profile, --profile-json and --max-memory """
+    func = click.option('--max-memory', type=MEMSIZE, default=None,
+                        help="The memory budget (e.g. 512M), the larger data are streamed or the command fails early")(func)
+    func = click.option('--profile-json', type=click.Path(readable=False),
+                        help="Save the profile of processing stages into JSON file")(func)
+    func = click.option('--profile', is_flag=True, help="Print the time spent in processing stages")(func)
+    return func
+
+
+def apply_common_options(ctx, profile, profile_json, max_memory):
+    """ Apply the shared options, the profile is reported when the command is finished
+    :param ctx: The click context of tool group
+    :param profile: Print the profile of processing stages
+    :param profile_json: Path to JSON file for the profile (None if not saved)
+    :param max_memory: The memory budget in bytes (None for unlimited)
+    """
+    uboot.set_max_memory(max_memory)
+    if profile or profile_json:
+        prof = uboot.Profile()
+        prof.start()
+
+        def report():
+            prof.stop()
+            if profile:
+                click.echo("\n Profile:\n" + prof.info())
+            if profile_json:
+                prof.save(profile_json)
+
+        ctx.call_on_close(report)
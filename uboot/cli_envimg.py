@@ -16,6 +16,7 @@ import os
 import sys
 import click
 import uboot
+from uboot.cli_common import common_options, apply_common_options
 
 # Application error code
 ERROR_CODE = 1
@@ -32,8 +33,11 @@ DESCRIP = (
 # U-Boot envimg: Base options
 @click.group(context_settings=dict(help_option_names=['-?', '--help']), help=DESCRIP)
 @click.version_option(VERSION, '-v', '--version')
-def cli():
+@common_options
+@click.pass_context
+def cli(ctx, profile, profile_json, max_memory):
     click.echo()
+    apply_common_options(ctx, profile, profile_json, max_memory)
 
 
 # U-Boot envimg: List U-Boot environment variables
@@ -16,6 +16,7 @@ import os
 import sys
 import click
 import uboot
+from uboot.cli_common import common_options, apply_common_options
 
 # Application error code
 ERROR_CODE = 1
@@ -54,8 +55,11 @@ UINT = UInt()
 # U-Boot mkenv: Base options
 @click.group(context_settings=dict(help_option_names=['-?', '--help']), help=DESCRIP)
 @click.version_option(VERSION, '-v', '--version')
-def cli():
+@common_options
+@click.pass_context
+def cli(ctx, profile, profile_json, max_memory):
     click.echo()
+    apply_common_options(ctx, profile, profile_json, max_memory)
 
 
 # U-Boot mkenv: List image content
@@ -67,7 +71,8 @@ def cli():
 def info(offset, size, bigendian, file):
     """ List image content """
     try:
-        with open(file, "rb") as f:
+        uboot.check_memory(size, "Reading of environment blob")
+        with uboot.span('read', size), open(file, "rb") as f:
             f.seek(offset)
             data = f.read(size)
 
@@ -96,8 +101,9 @@ def create(size, redundant, bigendian, infile, outfile):
         with open(infile, 'r') as f:
             env.load(f.read())
 
-        with open(outfile, 'wb') as f:
-            f.write(env.export())
+        data = env.export()
+        with uboot.span('write', len(data)), open(outfile, 'wb') as f:
+            f.write(data)
 
     except Exception as e:
         click.echo(str(e) if str(e) else "Unknown Error !")
@@ -117,7 +123,8 @@ def extract(offset, size, bigendian, file):
     try:
         fileName, _ = os.path.splitext(file)
 
-        with open(file, "rb") as f:
+        uboot.check_memory(size, "Reading of environment blob")
+        with uboot.span('read', size), open(file, "rb") as f:
             f.seek(offset)
             data = f.read(size)
 
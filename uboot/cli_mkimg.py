@@ -14,8 +14,10 @@
 
 import os
 import sys
+import time
 import click
 import uboot
+from uboot.cli_common import common_options, apply_common_options
 
 # Application error code
 ERROR_CODE = 1
@@ -29,6 +31,17 @@ DESCRIP = (
 )
 
 
+def write_chunks(f, data):
+    """ Write the data into file in chunks, so the mapped input isn't loaded into memory at once
+    :param f: The file opened for writing
+    :param data: The data as bytes-like object or iterable of bytes chunks
+    """
+    for chunk in uboot.common.iter_chunks(data):
+        for index in range(0, len(chunk), uboot.CHUNK_SIZE):
+            with uboot.span('write', min(uboot.CHUNK_SIZE, len(chunk) - index)):
+                f.write(chunk[index:index + uboot.CHUNK_SIZE])
+
+
 # User defined class
 class UInt(click.ParamType):
     """ Custom argument type for UINT """
@@ -55,13 +68,17 @@ ARCT = [item[0] for item in uboot.EnumArchType]
 OST  = [item[0] for item in uboot.EnumOsType]
 IMGT = [item[0] for item in uboot.EnumImageType]
 COMT = [item[0] for item in uboot.EnumCompressionType]
+POLT = ['size', 'speed']
 
 
 # U-Boot mkimg: Base options
 @click.group(context_settings=dict(help_option_names=['-?', '--help']), help=DESCRIP)
 @click.version_option(VERSION, '-v', '--version')
-def cli():
+@common_options
+@click.pass_context
+def cli(ctx, profile, profile_json, max_memory):
     click.echo()
+    apply_common_options(ctx, profile, profile_json, max_memory)
 
 
 @cli.command(short_help="Show old image content")
@@ -69,9 +86,8 @@ def cli():
 def info(file):
     """ List old image content in readable format """
     try:
-        with open(file, 'rb') as f:
-            img = uboot.parse_img(f.read())
-            click.echo(img.info())
+        img = uboot.parse_img_file(file)
+        click.echo(img.info())
 
     except Exception as e:
         click.echo(str(e) if str(e) else "Unknown Error !")
@@ -83,57 +99,134 @@ def info(file):
 def infoitb(file):
     """ List new image content in readable format """
     try:
-        with open(file, 'rb') as f:
-            img = uboot.parse_itb(f.read())
-            click.echo(img.info())
+        # Only the FDT structure is walked, the data of images are mapped
+        img = uboot.parse_itb_file(file, native=True)
+        click.echo(img.info())
 
     except Exception as e:
         click.echo(str(e) if str(e) else "Unknown Error !")
         sys.exit(ERROR_CODE)
 
 
+@cli.command(short_help="Verify the hashes of new image content")
+@click.option('-j', '--jobs', type=UINT, default=0, show_default=True,
+              help="The number of threads for hashing of images (0: CPU count)")
+@click.argument('file', nargs=1, type=click.Path(exists=True))
+def verifyitb(jobs, file):
+    """ Verify the hash nodes of new image content """
+    try:
+        # The data of images are hashed from mapped file in parallel threads
+        img = uboot.parse_itb_file(file, native=True)
+        results = img.verify_hashes(jobs or os.cpu_count())
+        click.echo(" {0:<20s} {1:<12s} {2:<8s} {3:s}".format("Image", "Hash", "Algo", "Result"))
+        for item in results:
+            click.echo(" {0:<20s} {1:<12s} {2:<8s} {3:s}".format(
+                item.image, item.node, item.algo, "OK" if item.valid else "BAD"))
+
+    except Exception as e:
+        click.echo(str(e) if str(e) else "Unknown Error !")
+        sys.exit(ERROR_CODE)
+
+    failed = sum(1 for item in results if not item.valid)
+    if failed:
+        click.echo("\n Invalid Hashes: %d" % failed)
+        sys.exit(ERROR_CODE)
+    click.secho("\n Verified Hashes: %d" % len(results))
+
+
+@cli.command(short_help="Scan raw data for old images")
+@click.option('-o', '--offset', type=UINT, default=0, show_default=True, help="The offset where the scan starts")
+@click.option('-i', '--ignore-crc', is_flag=True, default=False, help="Report also headers with invalid CRC")
+@click.option('-j', '--jobs', type=UINT, default=1, show_default=True, help="The number of worker processes (0: CPU count)")
+@click.argument('file', nargs=1, type=click.Path(exists=True))
+def scan(offset, ignore_crc, jobs, file):
+    """ Scan raw data (flash dump, etc.) for old U-Boot images """
+    try:
+        n = 0
+        click.echo(" {0:<12s} {1:<14s} {2:>12s}  {3:4s}  {4:4s}  {5:s}".format(
+            "Offset", "Type", "Size", "HCRC", "DCRC", "Name"))
+        for item in uboot.scan_file(file, offset, ignore_crc=ignore_crc, workers=jobs):
+            click.echo(" 0x{0:08X}   {1:<14s} {2:>12d}  {3:4s}  {4:4s}  {5:s}".format(
+                item.offset,
+                uboot.EnumImageType[item.header.image_type],
+                item.header.data_size,
+                "OK" if item.header_crc_ok else "BAD",
+                "OK" if item.data_crc_ok else "BAD",
+                item.header.name))
+            n += 1
+
+    except Exception as e:
+        click.echo(str(e) if str(e) else "Unknown Error !")
+        sys.exit(ERROR_CODE)
+
+    click.secho("\n Found Images: %d" % n)
+
+
 @cli.command(short_help="Create old U-Boot image from attached files")
 @click.option('-a', '--arch', type=click.Choice(ARCT), default='arm', show_default=True, help='Architecture')
 @click.option('-o', '--ostype', type=click.Choice(OST), default='linux', show_default=True, help='Operating system')
 @click.option('-i', '--imgtype', type=click.Choice(IMGT), default='firmware', show_default=True, help='Image type')
-@click.option('-c', '--compress', type=click.Choice(COMT), default='none', show_default=True, help='Image compression')
+@click.option('-c', '--compress', type=click.Choice(COMT + ['auto']), default='none', show_default=True,
+              help='Image compression (auto: select the best by measurement)')
+@click.option('-p', '--precompressed', is_flag=True, default=False, help="The input data are already compressed")
+@click.option('-j', '--jobs', type=UINT, default=1, show_default=True,
+              help="The number of threads for GZIP compression or processes for auto selection (0: CPU count)")
+@click.option('--policy', type=click.Choice(POLT), default='size', show_default=True,
+              help="The policy of auto compression: smallest size or fastest load + decompression")
+@click.option('--read-speed', type=click.FLOAT, default=10.0, show_default=True,
+              help="The read speed of boot media in MB/s (used by speed policy)")
 @click.option('-l', '--laddr',  type=UINT, default=0, show_default=True, help="Load address")
 @click.option('-e', '--epaddr', type=UINT, default=0, show_default=True, help="Entry point address")
 @click.option('-n', '--name', type=click.STRING, default="", help="Image name (max: 32 chars)")
 @click.argument('outfile', nargs=1, type=click.Path(readable=False))
 @click.argument('infiles',  nargs=-1, type=click.Path(exists=True))
-def create(arch, ostype, imgtype, compress, laddr, epaddr, name, outfile, infiles):
+def create(arch, ostype, imgtype, compress, precompressed, jobs, policy, read_speed, laddr, epaddr, name, outfile,
+           infiles):
     """ Create old U-Boot image from attached files """
     try:
         img_type = uboot.EnumImageType[imgtype]
 
         if img_type == uboot.EnumImageType.MULTI:
-            img = uboot.MultiImage
+            img = uboot.MultiImage()
             for file in infiles:
-                with open(file, 'rb') as f:
-                    simg = uboot.parse_img(f.read())
-                    img.append(simg)
+                # The images are memory mapped and streamed into output file
+                img.append(uboot.parse_img_file(file))
 
-        elif img_type == uboot.EnumImageType.MULTI:
+        elif img_type == uboot.EnumImageType.SCRIPT:
             img = uboot.ScriptImage()
             with open(infiles[0], 'r') as f:
                 img.load(f.read())
 
+        elif compress == 'auto':
+            report = uboot.select_codec(uboot.FileData(infiles[0]), policy, read_speed * 1024 * 1024,
+                                        workers=jobs or None)
+            click.echo(report.info())
+            compress = uboot.EnumCompressionType[report.comp_type]
+            data = report.data
+            if data is None:
+                # The data over memory budget are compressed again on the fly by selected codec
+                data = uboot.iter_compress(uboot.FileData(infiles[0]), report.comp_type, threads=jobs or os.cpu_count())
+            img = uboot.StdImage(data, image=img_type)
+
         else:
-            img = uboot.StdImage(image=img_type)
-            with open(infiles[0], 'rb') as f:
-                img.data = bytearray(f.read())
+            # The data are streamed from input file (through compressor) into output file
+            data = uboot.FileData(infiles[0])
+            if not precompressed and compress != 'none':
+                data = uboot.iter_compress(data, uboot.EnumCompressionType[compress], threads=jobs or os.cpu_count())
+            img = uboot.StdImage(data, image=img_type)
+
+        if compress == 'auto':
+            raise Exception("Auto compression is supported for data images only !")
 
         img.header.arch_type = uboot.EnumArchType[arch]
         img.header.os_type = uboot.EnumOsType[ostype]
         img.header.compression = uboot.EnumCompressionType[compress]
         img.header.load_address = laddr
-        img.header.entry_point = epaddr
+        img.header.entry_address = epaddr
         img.header.name = name
 
+        img.save(outfile)
         click.echo(img.info())
-        with open(outfile, 'wb') as f:
-            f.write(img.export())
 
     except Exception as e:
         click.echo(str(e) if str(e) else "Unknown Error !")
@@ -142,24 +235,73 @@ def create(arch, ostype, imgtype, compress, laddr, epaddr, name, outfile, infile
     click.secho("\n Created Image: %s" % outfile)
 
 
+@cli.command(short_help="Patch old U-Boot images in place")
+@click.option('-a', '--arch', type=click.Choice(ARCT), default=None, help='Architecture')
+@click.option('-o', '--ostype', type=click.Choice(OST), default=None, help='Operating system')
+@click.option('-c', '--compress', type=click.Choice(COMT), default=None, help='Image compression (header only)')
+@click.option('-l', '--laddr',  type=UINT, default=None, help="Load address")
+@click.option('-e', '--epaddr', type=UINT, default=None, help="Entry point address")
+@click.option('-n', '--name', type=click.STRING, default=None, help="Image name (max: 32 chars)")
+@click.option('-t', '--stamp', is_flag=True, default=False, help="Set the time stamp to current time")
+@click.option('-d', '--data', type=(UINT, click.Path(exists=True)), multiple=True,
+              help="Replace the image data at <offset> by content of <file>")
+@click.option('--offset', type=UINT, default=0, show_default=True, help="The offset of image inside file")
+@click.argument('files', nargs=-1, required=True, type=click.Path(exists=True))
+def patch(arch, ostype, compress, laddr, epaddr, name, stamp, data, offset, files):
+    """ Patch old U-Boot images in place, only the header and replaced data are rewritten """
+    try:
+        patches = []
+        for data_offset, data_file in data:
+            with uboot.span('read', os.path.getsize(data_file)), open(data_file, 'rb') as f:
+                patches.append((data_offset, f.read()))
+
+        fields = dict(laddr=laddr, eaddr=epaddr, name=name,
+                      arch=arch and uboot.EnumArchType[arch],
+                      os=ostype and uboot.EnumOsType[ostype],
+                      compress=compress and uboot.EnumCompressionType[compress],
+                      time=int(time.time()) if stamp else None)
+        fields = {key: value for key, value in fields.items() if value is not None}
+
+        for file in files:
+            header = uboot.patch_img_file(file, offset, patches, **fields)
+            if len(files) == 1:
+                click.echo(header.info())
+
+    except Exception as e:
+        click.echo(str(e) if str(e) else "Unknown Error !")
+        sys.exit(ERROR_CODE)
+
+    click.secho("\n Patched Images: %d" % len(files))
+
+
 @cli.command(short_help="Create new U-Boot image from *.its file")
 @click.option('-o', '--outfile', type=click.Path(readable=False), default=None, help="Output file")
 @click.option('-p', '--padding', type=UINT, default=0, help="Add padding to the blob of <bytes> long")
-@click.option('-a', '--align', type=UINT, default=None, help="Make the blob align to the <bytes>")
+@click.option('-a', '--align', type=UINT, default=None,
+              help="Align the external data to the <bytes> (the blob with embedded data is aligned)")
 @click.option('-s', '--size', type=UINT, default=None, help="Make the blob at least <bytes> long")
+@click.option('-E', '--external', is_flag=True, default=False,
+              help="Place the data outside of FDT structure, they are streamed from input files")
+@click.option('-j', '--jobs', type=UINT, default=1, show_default=True,
+              help="The number of threads for hashing and writing of external data (0: CPU count)")
 @click.argument('itsfile',  nargs=1, type=click.Path(exists=True))
-def createitb(outfile, padding, align, size, itsfile):
+def createitb(outfile, padding, align, size, external, jobs, itsfile):
     """ Create new U-Boot image from *.its file """
 
     try:
         if outfile is None:
             outfile = os.path.splitext(itsfile)[0] + ".itb"
 
+        # The /incbin/ data are referenced only, so the memory budget is checked before they are read
         with open(itsfile, 'r') as f:
-            img = uboot.parse_its(f.read(), os.path.dirname(itsfile))
+            img = uboot.parse_its(f.read(), os.path.dirname(itsfile), lazy=True)
 
-        with open(outfile, 'wb') as f:
-            f.write(img.to_itb(padding, align, size))
+        if external:
+            img.to_itb_file(outfile, padding, align, size, workers=jobs or os.cpu_count())
+        else:
+            itb = img.to_itb(padding, align, size, workers=jobs or os.cpu_count())
+            with uboot.span('write', len(itb)), open(outfile, 'wb') as f:
+                f.write(itb)
 
     except Exception as e:
         click.echo(str(e) if str(e) else "Unknown Error !")
@@ -169,19 +311,13 @@ def createitb(outfile, padding, align, size, itsfile):
 
 
 @cli.command(short_help="Extract content from old U-Boot image")
+@click.option('-r', '--raw', is_flag=True, default=False, help="Don't decompress the image data")
 @click.argument('file',  nargs=1, type=click.Path(exists=True))
-def extract(file):
+def extract(raw, file):
     """ Extract content from old U-Boot image """
 
-    def get_file_ext(img):
-        ext = ('bin', 'gz', 'bz2', 'lzma', 'lzo', 'lz4')
-        return ext[img.compression]
-
     try:
-        with open(file, 'rb') as f:
-            raw_data = f.read()
-
-        img = uboot.parse_img(raw_data)
+        img = uboot.parse_img_file(file)
 
         file_path, file_name = os.path.split(file)
         dest_dir = os.path.normpath(os.path.join(file_path, file_name + ".ex"))
@@ -190,16 +326,27 @@ def extract(file):
         if img.header.image_type == uboot.EnumImageType.MULTI:
             n = 0
             for simg in img:
-                with open(os.path.join(dest_dir, 'image_{0:02d}.bin'.format(n)), 'wb') as f:
-                    f.write(simg.export())
+                # The images are streamed from mapped file
+                simg.save(os.path.join(dest_dir, 'image_{0:02d}.bin'.format(n)))
                 n += 1
         elif img.header.image_type == uboot.EnumImageType.SCRIPT:
             with open(os.path.join(dest_dir, 'script.txt'), 'w') as f:
                 f.write(img.store())
 
+        elif raw or img.header.compression == uboot.EnumCompressionType.NONE or \
+                img.header.compression not in uboot.compression.get_codecs():
+            if not raw and img.header.compression != uboot.EnumCompressionType.NONE:
+                click.echo(" Not supported compression: {}, the data are extracted compressed".format(
+                    uboot.EnumCompressionType[img.header.compression]))
+            ext = ('bin', 'gz', 'bz2', 'lzma', 'lzo', 'lz4')[img.header.compression]
+            with open(os.path.join(dest_dir, 'image.' + ext), 'wb') as f:
+                # The data are written from mapped file in chunks
+                write_chunks(f, img.data)
+
         else:
-            with open(os.path.join(dest_dir, 'image.' + get_file_ext(img)), 'wb') as f:
-                f.write(img.data)
+            # The data are decompressed in chunks
+            with open(os.path.join(dest_dir, 'image.bin'), 'wb') as f:
+                write_chunks(f, uboot.iter_decompress(img.data, img.header.compression))
 
         with open(os.path.join(dest_dir, 'info.txt'), 'w') as f:
             f.write(img.info())
@@ -217,8 +364,7 @@ def extractitb(file):
     """ Extract content from new U-Boot image """
 
     try:
-        with open(file, 'rb') as f:
-            img = uboot.parse_itb(f.read())
+        img = uboot.parse_itb_file(file, native=True)
 
         file_path, file_name = os.path.split(file)
         dest_dir = os.path.normpath(os.path.join(file_path, file_name + ".ex"))
@@ -231,7 +377,8 @@ def extractitb(file):
 
         for name, data in images.items():
             with open(os.path.join(dest_dir, name), 'wb') as f:
-                f.write(data)
+                # The external data are written from mapped file in chunks
+                write_chunks(f, data)
 
     except Exception as e:
         click.echo(str(e) if str(e) else "Unknown Error !")
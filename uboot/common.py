@@ -12,9 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Executor, ThreadPoolExecutor
 from easy_enum import Enum
 
+from .tracing import span
+
 # ----------------------------------------------------------------------------------------------------------------------
 # Image Types
 # ----------------------------------------------------------------------------------------------------------------------
@@ -181,3 +186,170 @@ class EnumCompressionType(Enum):
     LZMA = (3, 'lzma', 'Compressed with LZMA')
     LZO = (4, 'lzo', 'Compressed with LZO')
     LZ4 = (5, 'lz4', 'Compressed with LZ4')
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Data Blobs
+# ----------------------------------------------------------------------------------------------------------------------
+
+# The default size of chunks used for streaming of large data
+CHUNK_SIZE = 1024 * 1024
+
+# The memory budget of operations in bytes (None: unlimited), see set_max_memory()
+_max_memory = None
+
+
+def set_max_memory(size):
+    """ Set the memory budget of operations, the data over budget are streamed in chunks (e.g. automatic compression
+        selection) and the operations which must hold them in memory (e.g. export() into bytes) fail early
+    :param size: The max size of data held in memory in bytes (None: unlimited)
+    """
+    global _max_memory
+    if size is not None and size <= 0:
+        raise Exception("Memory: The budget must be a positive value !")
+    _max_memory = size
+
+
+def get_max_memory():
+    """ Get the memory budget of operations
+    :return: The size in bytes or None if unlimited
+    """
+    return _max_memory
+
+
+def fits_memory(size):
+    """ Check if the data of given size fit into memory budget
+    :param size: The size of data in bytes
+    :return: True or False
+    """
+    return _max_memory is None or size <= _max_memory
+
+
+def check_memory(size, operation):
+    """ Check the memory budget before operation which holds the data in memory
+    :param size: The size of data held in memory in bytes
+    :param operation: The name of operation used in error message
+    """
+    if not fits_memory(size):
+        raise Exception("Memory: {0:s} needs {1:.1f} MB, it's over the budget of {2:.1f} MB !".format(
+            operation, size / 1024 / 1024, _max_memory / 1024 / 1024))
+
+
+class FileData(object):
+    """ Data blob stored in a file, the content is read in chunks only when required """
+
+    def __init__(self, file, offset=0, size=None):
+        """ File Data Constructor
+        :param file:   Path to the file
+        :param offset: The offset of data inside the file
+        :param size:   The size of data (default: up to the end of file)
+        """
+        file_size = os.path.getsize(file)
+        if size is None:
+            size = file_size - offset
+        if offset < 0 or size < 0 or offset + size > file_size:
+            raise Exception("FileData: Out of file range: %s" % file)
+        self.file = file
+        self.offset = offset
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __bytes__(self):
+        return self.read()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            data = self.read(start, max(stop - start, 0))
+            return data if step == 1 else data[::step]
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError("FileData: Index out of range")
+        return self.read(key, 1)[0]
+
+    def read(self, offset=0, size=None):
+        """ Read the data into memory
+        :param offset: The offset inside data
+        :param size:   The size of read data (default: up to the end)
+        :return: The data as bytes
+        """
+        if size is None:
+            size = self.size - offset
+        check_memory(size, "Reading of file data")
+        with span('read', size), open(self.file, 'rb') as f:
+            f.seek(self.offset + offset)
+            return f.read(size)
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        """ Read the data in chunks
+        :param chunk_size: The max size of one chunk
+        :return: Iterator of chunks as bytes
+        """
+        with open(self.file, 'rb') as f:
+            f.seek(self.offset)
+            size = self.size
+            while size > 0:
+                with span('read', min(chunk_size, size)):
+                    chunk = f.read(min(chunk_size, size))
+                if not chunk:
+                    raise Exception("FileData: Unexpected end of file: %s" % self.file)
+                size -= len(chunk)
+                yield chunk
+
+
+def iter_chunks(data, chunk_size=CHUNK_SIZE):
+    """ Help function for iterating over data blob in chunks
+    :param data: The data as bytes-like object, FileData or iterable of bytes chunks
+    :param chunk_size: The max size of one chunk read from a file
+    :return: Iterator of chunks, in-memory data are returned as one zero-copy view
+    """
+    if isinstance(data, FileData):
+        yield from data.iter_chunks(chunk_size)
+        return
+
+    try:
+        view = memoryview(data)
+    except TypeError:
+        yield from data
+    else:
+        yield view
+
+
+@contextmanager
+def get_executor(workers):
+    """ Help function for getting a thread pool
+    :param workers: The max number of threads or an existing Executor which is shared (not shut down)
+    :return: Context manager of Executor
+    """
+    if isinstance(workers, Executor):
+        yield workers
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield executor
+
+
+# The state of threads running the tasks of library pools, see pool_task()
+_pool_local = threading.local()
+
+
+def pool_task(func, *args, **kwargs):
+    """ Help function for running the task of thread or process pool: executor.submit(pool_task, func, arg).
+        The nested parallel operations (e.g. CRC32 of large data) run serially inside it, so the pools
+        don't oversubscribe the CPU.
+    :param func: The task function
+    :return: The result of task
+    """
+    nested = getattr(_pool_local, 'active', False)
+    _pool_local.active = True
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _pool_local.active = nested
+
+
+def in_pool_task():
+    """ Check if the current thread runs a task of library pool (see pool_task) """
+    return getattr(_pool_local, 'active', False)
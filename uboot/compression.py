@@ -0,0 +1,437 @@
+# Copyright 2018 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import bz2
+import time
+import zlib
+import lzma
+from struct import pack
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .common import EnumCompressionType, FileData, CHUNK_SIZE, iter_chunks, fits_memory
+from .tracing import span
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Codecs
+# ----------------------------------------------------------------------------------------------------------------------
+
+# The codec is defined by factories of streaming compressor and decompressor objects:
+#   compressor(level)  -> object with compress(data) and flush() methods, level can be None (default level)
+#   decompressor()     -> object with decompress(data, max_length) method and eof, unused_data attributes,
+#                         the not returned data are kept in unconsumed_tail attribute (zlib) or internally (needs_input)
+Codec = namedtuple('Codec', ['compressor', 'decompressor', 'ext'])
+
+_CODECS = {}
+
+
+class _NoneCompressor(object):
+
+    def compress(self, data):
+        return bytes(data)
+
+    def flush(self):
+        return b''
+
+
+class _NoneDecompressor(object):
+    eof = False
+    unused_data = b''
+    needs_input = True
+
+    def decompress(self, data, max_length=-1):
+        return bytes(data)
+
+
+class _Lz4Compressor(object):
+
+    def __init__(self, level=None):
+        import lz4.frame
+        self._obj = lz4.frame.LZ4FrameCompressor(compression_level=level or 0)
+        self._head = self._obj.begin()
+
+    def compress(self, data):
+        head, self._head = self._head, b''
+        return head + self._obj.compress(data)
+
+    def flush(self):
+        head, self._head = self._head, b''
+        return head + self._obj.flush()
+
+
+def register_codec(comp_type, compressor, decompressor, ext='bin'):
+    """ Register the codec for compression type (plug-in hook for LZ4, LZO, ...)
+    :param comp_type: The compression type (EnumCompressionType)
+    :param compressor: Factory of compressor object: compressor(level)
+    :param decompressor: Factory of decompressor object: decompressor()
+    :param ext: The file extension of compressed data
+    """
+    if isinstance(comp_type, str):
+        comp_type = EnumCompressionType[comp_type]
+    if comp_type not in EnumCompressionType:
+        raise Exception("Compression: Unknown type: %d" % comp_type)
+    _CODECS[comp_type] = Codec(compressor, decompressor, ext)
+
+
+def get_codec(comp_type):
+    """ Get the codec of compression type
+    :param comp_type: The compression type (EnumCompressionType)
+    :return: Codec object
+    """
+    if isinstance(comp_type, str):
+        comp_type = EnumCompressionType[comp_type]
+    if comp_type not in _CODECS:
+        name = EnumCompressionType[comp_type] if comp_type in EnumCompressionType else comp_type
+        raise Exception("Compression: Not supported type: {}".format(name))
+    return _CODECS[comp_type]
+
+
+def get_codecs():
+    """ Get all available compression types
+    :return: List of compression types (EnumCompressionType)
+    """
+    return sorted(_CODECS.keys())
+
+
+register_codec(EnumCompressionType.NONE,
+               lambda level: _NoneCompressor(),
+               lambda: _NoneDecompressor(),
+               'bin')
+register_codec(EnumCompressionType.GZIP,
+               lambda level: zlib.compressobj(9 if level is None else level, zlib.DEFLATED, 16 + zlib.MAX_WBITS),
+               lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+               'gz')
+register_codec(EnumCompressionType.BZIP2,
+               lambda level: bz2.BZ2Compressor(9 if level is None else level),
+               lambda: bz2.BZ2Decompressor(),
+               'bz2')
+# U-Boot supports the legacy .lzma format only
+register_codec(EnumCompressionType.LZMA,
+               lambda level: lzma.LZMACompressor(lzma.FORMAT_ALONE, preset=level),
+               lambda: lzma.LZMADecompressor(lzma.FORMAT_AUTO),
+               'lzma')
+
+try:
+    import lz4.frame
+    register_codec(EnumCompressionType.LZ4,
+                   lambda level: _Lz4Compressor(level),
+                   lambda: lz4.frame.LZ4FrameDecompressor(),
+                   'lz4')
+except ImportError:
+    pass
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Parallel GZIP
+# ----------------------------------------------------------------------------------------------------------------------
+
+# The size of blocks compressed in parallel and the size of dictionary shared with previous block
+GZIP_BLOCK_SIZE = 128 * 1024
+GZIP_DICT_SIZE = 32 * 1024
+
+
+def _deflate_block(block, zdict, level):
+    """ Compress one block into raw deflate data aligned to byte boundary (not a final block) """
+    if zdict:
+        obj = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict)
+    else:
+        obj = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    with span('compress', len(block)):
+        return obj.compress(block) + obj.flush(zlib.Z_SYNC_FLUSH)
+
+
+def _iter_blocks(chunks, block_size):
+    """ Split the stream of chunks into blocks of the same size """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= block_size:
+            yield bytes(buffer[:block_size])
+            del buffer[:block_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def _iter_gzip_parallel(chunks, level, threads, block_size):
+    """ Compress the stream of chunks into single GZIP member by independent blocks (like pigz) """
+    level = 9 if level is None else level
+    size, crc = 0, 0
+    zdict = None
+
+    # GZIP header: magic, deflate, no flags, no time stamp, no extra flags, OS: Unix
+    yield b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\x03'
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = deque()
+        for block in _iter_blocks(chunks, block_size):
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            pending.append(executor.submit(_deflate_block, block, zdict, level))
+            zdict = block[-GZIP_DICT_SIZE:]
+            # Limit the number of blocks in memory
+            while len(pending) > threads * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    # The final empty block with fixed Huffman codes and GZIP trailer
+    yield b'\x03\x00'
+    yield pack('<2L', crc & 0xFFFFFFFF, size & 0xFFFFFFFF)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Helper methods
+# ----------------------------------------------------------------------------------------------------------------------
+def iter_compress(chunks, comp_type, level=None, threads=None, block_size=GZIP_BLOCK_SIZE):
+    """ Compress the stream of data chunks
+    :param chunks: The data as bytes-like object, FileData or iterable of bytes chunks
+    :param comp_type: The compression type (EnumCompressionType)
+    :param level: The compression level (default: codec specific)
+    :param threads: The number of threads, GZIP is compressed by independent blocks in parallel
+    :param block_size: The size of blocks compressed in parallel
+    :return: Iterator of compressed chunks
+    """
+    if isinstance(comp_type, str):
+        comp_type = EnumCompressionType[comp_type]
+
+    if threads and threads > 1 and comp_type == EnumCompressionType.GZIP:
+        yield from _iter_gzip_parallel(iter_chunks(chunks), level, threads, block_size)
+        return
+
+    obj = get_codec(comp_type).compressor(level)
+    for chunk in iter_chunks(chunks):
+        # The in-memory data are compressed by parts, so the output is streamed in bounded chunks too
+        chunk = memoryview(chunk)
+        for index in range(0, len(chunk), CHUNK_SIZE):
+            part = chunk[index:index + CHUNK_SIZE]
+            with span('compress', len(part)):
+                data = obj.compress(part)
+            if data:
+                yield data
+    with span('compress'):
+        data = obj.flush()
+    if data:
+        yield data
+
+
+def iter_decompress(chunks, comp_type, chunk_size=CHUNK_SIZE):
+    """ Decompress the stream of data chunks, the concatenated streams (members) are supported
+    :param chunks: The compressed data as bytes-like object, FileData or iterable of bytes chunks
+    :param comp_type: The compression type (EnumCompressionType)
+    :param chunk_size: The max size of input and output chunks
+    :return: Iterator of decompressed chunks
+    """
+    if isinstance(comp_type, str):
+        comp_type = EnumCompressionType[comp_type]
+
+    codec = get_codec(comp_type)
+    obj = codec.decompressor()
+
+    for chunk in iter_chunks(chunks, chunk_size):
+        chunk = memoryview(chunk)
+        for index in range(0, len(chunk), chunk_size):
+            data = chunk[index:index + chunk_size]
+            while data:
+                if obj.eof:
+                    # The next stream (member) follows or it's zero padding behind the last one
+                    if not bytes(data).strip(b'\0'):
+                        break
+                    obj = codec.decompressor()
+                with span('decompress', len(data)):
+                    out = obj.decompress(data, chunk_size)
+                data = getattr(obj, 'unconsumed_tail', b'')
+                while True:
+                    if out:
+                        yield out
+                    if obj.eof or getattr(obj, 'needs_input', True):
+                        break
+                    with span('decompress'):
+                        out = obj.decompress(b'', chunk_size)
+                if obj.eof:
+                    data = obj.unused_data
+
+    if comp_type != EnumCompressionType.NONE and not obj.eof:
+        raise Exception("Compression: Unexpected end of {} data".format(EnumCompressionType[comp_type]))
+
+
+def compress(data, comp_type, level=None, threads=None):
+    """ Compress the data
+    :param data: The data as bytes-like object or FileData
+    :param comp_type: The compression type (EnumCompressionType)
+    :param level: The compression level (default: codec specific)
+    :param threads: The number of threads, GZIP is compressed by independent blocks in parallel
+    :return: The compressed data as bytes
+    """
+    return b''.join(iter_compress(data, comp_type, level, threads))
+
+
+def decompress(data, comp_type):
+    """ Decompress the data
+    :param data: The compressed data as bytes-like object or FileData
+    :param comp_type: The compression type (EnumCompressionType)
+    :return: The decompressed data as bytes
+    """
+    return b''.join(iter_decompress(data, comp_type))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Automatic Selection
+# ----------------------------------------------------------------------------------------------------------------------
+
+# The default read speed of boot media in bytes per second (used by 'speed' policy)
+READ_SPEED = 10 * 1024 * 1024
+
+# The measured results of one codec, the times are in seconds and the cost is given by selection policy
+CodecStats = namedtuple('CodecStats', ['comp_type', 'size', 'comp_time', 'decomp_time', 'cost'])
+
+
+class CompressionReport(object):
+    """ The result of automatic compression selection """
+
+    def __init__(self, policy, data_size, stats, comp_type, data):
+        """ Compression Report Constructor
+        :param policy: The name of used policy
+        :param data_size: The size of uncompressed data
+        :param stats: The list of CodecStats for all tested codecs
+        :param comp_type: The selected compression type
+        :param data: The data compressed by selected codec or None if the data were over memory budget
+                     (compress them by iter_compress() with selected codec)
+        """
+        self.policy = policy
+        self.data_size = data_size
+        self.stats = stats
+        self.comp_type = comp_type
+        self.data = data
+
+    def __str__(self):
+        return self.info()
+
+    def __repr__(self):
+        return self.info()
+
+    def info(self):
+        def speed(time_s):
+            return "{0:.1f}".format(self.data_size / time_s / 1024 / 1024) if time_s else "-"
+
+        msg = " {0:<6s} {1:>12s} {2:>7s} {3:>12s} {4:>14s} {5:>12s}\n".format(
+            "Codec", "Size [B]", "Ratio", "Comp [MB/s]", "Decomp [MB/s]", "Cost")
+        for item in sorted(self.stats, key=lambda x: x.cost):
+            msg += " {0:<6s} {1:>12d} {2:>7.3f} {3:>12s} {4:>14s} {5:>12.6g}{6:s}\n".format(
+                EnumCompressionType[item.comp_type],
+                item.size,
+                item.size / self.data_size if self.data_size else 1.0,
+                speed(item.comp_time),
+                speed(item.decomp_time),
+                item.cost,
+                " *" if item.comp_type == self.comp_type else "")
+        msg += "\n Selected: {0:s} (policy: {1:s})\n".format(EnumCompressionType[self.comp_type], self.policy)
+        return msg
+
+
+def _measure_codec(args):
+    """ Compress and decompress the data by one codec, it's executed in worker process """
+    data, comp_type, level, keep = args
+    if keep:
+        start = time.perf_counter()
+        comp_data = compress(data, comp_type, level)
+        comp_time = time.perf_counter() - start
+        comp_size = len(comp_data)
+
+        start = time.perf_counter()
+        for _ in iter_decompress(comp_data, comp_type):
+            pass
+        decomp_time = time.perf_counter() - start
+    else:
+        # The data over memory budget are streamed, only the size of compressed data is counted
+        comp_data, comp_size = None, 0
+        start = time.perf_counter()
+        for chunk in iter_compress(data, comp_type, level):
+            comp_size += len(chunk)
+        comp_time = time.perf_counter() - start
+
+        # The compressed data are generated again on the fly, its time is subtracted
+        start = time.perf_counter()
+        for _ in iter_decompress(iter_compress(data, comp_type, level), comp_type):
+            pass
+        decomp_time = max(time.perf_counter() - start - comp_time, 0.0)
+
+    if comp_type == EnumCompressionType.NONE:
+        comp_time, decomp_time = 0.0, 0.0
+
+    return comp_type, comp_size, comp_data, comp_time, decomp_time
+
+
+def select_codec(data, policy='size', read_speed=READ_SPEED, candidates=None, level=None, workers=None):
+    """ Select the best compression of data by measuring all available codecs in a process pool
+    :param data: The data as bytes-like object or FileData (the file is read directly by workers)
+    :param policy: The selection policy: 'size' for smallest data, 'speed' for fastest estimated load and decompression
+                   at given read speed or function returning the cost of CodecStats (with cost = None)
+    :param read_speed: The read speed of boot media in bytes per second (used by 'speed' policy)
+    :param candidates: The list of tested compression types (default: all available codecs)
+    :param level: The compression level (default: codec specific)
+    :param workers: The number of worker processes (default: CPU count), 1 for measuring in current process
+    :return: CompressionReport object with selected compression and compressed data, if the data are over memory
+             budget (see set_max_memory) they are measured as stream and the compressed data aren't kept
+    """
+    if policy == 'size':
+        cost = lambda item: item.size
+    elif policy == 'speed':
+        cost = lambda item: item.size / read_speed + item.decomp_time
+    elif callable(policy):
+        cost = policy
+    else:
+        raise Exception("Compression: Unknown selection policy: {}".format(policy))
+
+    if candidates is None:
+        candidates = get_codecs()
+    if workers != 1 and len(candidates) > 1:
+        workers = min(workers or os.cpu_count() or 1, len(candidates))
+    else:
+        workers = 1
+
+    # Every worker holds its compressed data and the best ones are kept, the in-memory data are copied into workers
+    data_size = len(data) if isinstance(data, FileData) else memoryview(data).nbytes
+    keep = fits_memory(data_size * (workers + 2))
+    if not (keep or isinstance(data, FileData)):
+        workers = 1
+    elif not isinstance(data, FileData):
+        # The data are send into worker processes, the bytes are pickled much faster than other types
+        data = bytes(data)
+
+    tasks = [(data, comp_type, level, keep) for comp_type in candidates]
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+
+    stats, best, best_data = [], None, None
+    try:
+        results = executor.map(_measure_codec, tasks) if executor else map(_measure_codec, tasks)
+        for comp_type, comp_size, comp_data, comp_time, decomp_time in results:
+            item = CodecStats(comp_type, comp_size, comp_time, decomp_time, None)
+            item = item._replace(cost=cost(item))
+            stats.append(item)
+            # Keep only the compressed data of best codec, the first listed wins the tie
+            if best is None or item.cost < best.cost:
+                best, best_data = item, comp_data
+    finally:
+        if executor:
+            executor.shutdown()
+
+    if best is None:
+        raise Exception("Compression: No codec to select from !")
+
+    return CompressionReport(policy if isinstance(policy, str) else getattr(policy, '__name__', 'custom'),
+                             data_size, stats, best.comp_type, best_data)
@@ -16,6 +16,9 @@ import struct
 import binascii
 import collections
 
+from .common import check_memory
+from .tracing import traced
+
 
 class EnvBlob(object):
 
@@ -107,6 +110,7 @@ class EnvBlob(object):
     def clear(self):
         self._env.clear()
 
+    @traced('parse')
     def load(self, txt_data):
         """ Load variables from text file
         :param txt_data:
@@ -121,6 +125,7 @@ class EnvBlob(object):
                 name, value = line.split('=', 1)
                 self._env[name.strip()] = value.strip()
 
+    @traced('serialize')
     def store(self, txt_data=None):
         """ Store variables into text file
         :param txt_data:
@@ -140,11 +145,13 @@ class EnvBlob(object):
         return txt_data
 
     @classmethod
-    def parse(cls, data, offset=0, bigendian=False):
+    @traced('parse')
+    def parse(cls, data, offset=0, bigendian=False, ignore_crc=False):
         """ Parse the u-boot environment variables from bytearray.
-            :param data: The data in bytes array
+            :param data: The data in bytes array (or memoryview)
             :param offset: The offset of input data
             :param bigendian: The endian type
+            :param ignore_crc: Don't check the CRC (e.g. already verified)
         """
         env = cls(bigendian=bigendian)
 
@@ -158,12 +165,12 @@ class EnvBlob(object):
             env.redundant = False
             read_data = data[offset + 4:]
 
-        calc_crc = binascii.crc32(read_data) & 0xffffffff
-
-        if read_crc != calc_crc:
-            raise ValueError("Wrong CRC")
+        if not ignore_crc:
+            calc_crc = binascii.crc32(read_data) & 0xffffffff
+            if read_crc != calc_crc:
+                raise ValueError("Wrong CRC")
 
-        read_data = read_data.decode('utf-8', errors='ignore')
+        read_data = str(read_data, 'utf-8', errors='ignore')
 
         for s in read_data.split('\0'):
             if not s or s.startswith('\xFF') or s.startswith('\x00'):
@@ -173,11 +180,13 @@ class EnvBlob(object):
 
         return env
 
+    @traced('serialize')
     def export(self):
         """ Export the u-boot environment variables into bytearray.
         :return The environment variables in bytearray
         """
         env_size = self.size
+        check_memory(env_size, "Export of environment blob")
 
         if self._redundant:
             env_size -= 5
@@ -15,6 +15,9 @@
 import os
 import collections
 
+from .common import check_memory
+from .tracing import span, traced
+
 
 class EnvImgOld(object):
 
@@ -47,6 +50,7 @@ class EnvImgOld(object):
     def __repr__(self):
         return self.info()
 
+    @traced('parse')
     def _parse(self):
         """ Parse environment variables from image """
         self._env_offset = self._img.find(self._env_mark.encode())
@@ -72,6 +76,7 @@ class EnvImgOld(object):
             key, value = s.split('=', 1)
             self._env[key] = value
 
+    @traced('serialize')
     def _update(self):
         """ Update environment variables inside image """
         data = str()
@@ -160,7 +165,10 @@ class EnvImgOld(object):
         """ Import the u-boot image and parse environment variables from it.
         :param data: Image data in bytes
         """
-        self._img = data if isinstance(data, bytearray) else bytearray(data)
+        if not isinstance(data, bytearray):
+            check_memory(len(data), "Import of image")
+            data = bytearray(data)
+        self._img = data
         self._parse()
 
     def export_img(self):
@@ -174,8 +182,11 @@ class EnvImgOld(object):
         """ Open the u-boot image and parse environment variables from it.
         :param file: Path to image file
         """
-        with open(file, 'rb') as f:
-            self._img = bytearray(os.path.getsize(file))
+        size = os.path.getsize(file)
+        # The image is modified in memory, so it must fit into memory budget
+        check_memory(size, "Reading of image")
+        with span('read', size), open(file, 'rb') as f:
+            self._img = bytearray(size)
             f.readinto(self._img)
 
         self._parse()
@@ -186,5 +197,5 @@ class EnvImgOld(object):
         :param file: Path to image file
         """
         self._update()
-        with open(file, 'wb') as f:
+        with span('write', len(self._img)), open(file, 'wb') as f:
             f.write(self._img)
\ No newline at end of file
@@ -13,11 +13,29 @@
 # limitations under the License.
 
 
+import os
+import re
 import fdt
+import mmap
 import time
+import zlib
 import struct
+import hashlib
+from collections import OrderedDict, namedtuple
 
-from .common import EnumOsType, EnumArchType, EnumImageType, EnumCompressionType
+from .common import EnumOsType, EnumArchType, EnumImageType, EnumCompressionType, FileData, CHUNK_SIZE, \
+                    iter_chunks, check_memory, get_executor, pool_task
+from .tracing import span, traced, count_copy, count_alloc
+
+
+# The magic word and the size of header of device tree blob
+FDT_MAGIC = 0xD00DFEED
+FDT_HEADER_SIZE = 40
+
+# The data property of image included from file: data = /incbin/("file", offset, size);
+INCBIN_PATTERN = re.compile(r'(\bdata\s*=\s*)/incbin/\(\s*([^)]*?)\s*\)')
+# The prefix of file reference replacing the /incbin/ in lazy mode
+INCBIN_REF = '/incbin/:'
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -36,11 +54,86 @@ def get_data(obj):
         data = bytearray()
         for val in prop.data:
             data += struct.pack(">I", val)
+        count_alloc('get_data', len(data))
         return data
 
     raise Exception("Image data error")
 
 
+def get_raw(prop):
+    """ Get the raw value of property as bytes """
+    if isinstance(prop, fdt.PropBytes):
+        return bytes(prop.data)
+    if isinstance(prop, fdt.PropWords):
+        return b''.join(struct.pack(">I", val) for val in prop.data)
+    if isinstance(prop, fdt.PropStrings):
+        return b''.join(val.encode('ascii') + b'\0' for val in prop.data)
+    return b''
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Hash Nodes
+# ----------------------------------------------------------------------------------------------------------------------
+
+# The result of hash node verification
+HashResult = namedtuple('HashResult', ['image', 'node', 'algo', 'valid'])
+
+
+class _Crc32(object):
+    """ CRC32 with hashlib interface, the value is stored as one big-endian word """
+
+    def __init__(self):
+        self.crc = 0
+
+    def update(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+
+    def digest(self):
+        return struct.pack(">I", self.crc & 0xFFFFFFFF)
+
+
+def new_digest(algo):
+    """ Create the digest object for algorithm of hash node: crc32, md5, sha1, sha256, ... """
+    if algo == 'crc32':
+        return _Crc32()
+    try:
+        return hashlib.new(algo)
+    except ValueError:
+        raise Exception("FIT: Not supported hash algorithm: %s !" % algo)
+
+
+def hash_nodes(image):
+    """ Get the hash sub-nodes (hash-1, hash@1, ...) of image node """
+    return [node for node in image.nodes if node.name.startswith('hash') and node.exist_property('algo')]
+
+
+def calc_digests(data, algos, chunk_size=CHUNK_SIZE):
+    """ Calculate the digests of data by several algorithms in one pass. The data are streamed in chunks (FileData
+        is read by parts), hashlib and zlib release the GIL, so the images can be hashed in parallel threads.
+
+    :param data: The data as bytes, bytearray, memoryview, mmap or FileData
+    :param algos: The list of algorithms
+    :param chunk_size: The max size of hashed chunk
+    :return: The list of digests as bytes
+    """
+    digests = [new_digest(algo) for algo in algos]
+    for chunk in iter_chunks(data, chunk_size):
+        chunk = memoryview(chunk).cast('B')
+        for index in range(0, len(chunk), chunk_size):
+            part = chunk[index:index + chunk_size]
+            with span('checksum', len(part)):
+                for digest in digests:
+                    digest.update(part)
+    return [digest.digest() for digest in digests]
+
+
+def digest_prop(name, digest):
+    """ Create the property with digest (the CRC32 and SHA digests are stored as words like by mkimage) """
+    if len(digest) % 4 == 0:
+        return fdt.PropWords(name, *struct.unpack(">{}I".format(len(digest) // 4), digest))
+    return fdt.PropBytes(name, data=digest)
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 # FDT Image Class
 # ----------------------------------------------------------------------------------------------------------------------
@@ -73,6 +166,10 @@ class FdtImage(object):
                     msg += "  {}: 0x{:X}\n".format(p.name, p[0])
                 else:
                     msg += "  {}: {}\n".format(p.name, p[0])
+            for node in hash_nodes(img):
+                value = node.get_property('value')
+                msg += "  {}: {} {}\n".format(node.name, get_value(node, 'algo'),
+                                              '-' if value is None else get_raw(value).hex())
         for n, cfg in enumerate(self.configs):
             msg += "\n"
             msg += " CFG[{}] {}\n".format(n, cfg.name)
@@ -87,7 +184,8 @@ class FdtImage(object):
         :return:
         """
         assert isinstance(nfo, fdt.Node), "nfo type must be a fdt.Node"
-        assert isinstance(data, (bytes, bytearray)), "data type must be a bytes or bytearray"
+        assert isinstance(data, (bytes, bytearray, memoryview, FileData)), \
+            "data type must be a bytes, bytearray, memoryview or FileData"
 
         if not nfo.exist_property("type"):
             raise Exception("Image type must be defined")
@@ -120,6 +218,58 @@ class FdtImage(object):
                 raise Exception("add_cfg: Config Validation Error")
         self.configs.append(item)
 
+    def _calc_hashes(self, workers=None):
+        """ Calculate the digests of all hash nodes. Every image is hashed by one task in thread pool (all its hash
+            nodes in one pass), so only one chunk per worker is in memory.
+
+        :param workers: The number of threads or shared Executor (default: CPU count)
+        :return: The list of (image node, hash node, digest)
+        """
+        tasks = []
+        for image in self.img_info:
+            nodes = hash_nodes(image)
+            if nodes:
+                tasks.append((image, nodes, [get_value(node, 'algo') for node in nodes]))
+        if not tasks:
+            return []
+
+        def run(task):
+            return calc_digests(self.img_data[task[0].name], task[2])
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers == 1 or len(tasks) == 1:
+            digests = [run(task) for task in tasks]
+        else:
+            with get_executor(workers) as executor:
+                digests = list(executor.map(lambda task: pool_task(run, task), tasks))
+
+        return [(image, node, digest) for (image, nodes, _), values in zip(tasks, digests)
+                for node, digest in zip(nodes, values)]
+
+    def update_hashes(self, workers=None):
+        """ Calculate the values of hash nodes (hash-1 { algo = "sha256"; }; ...) of images
+
+        :param workers: The number of threads or shared Executor (default: CPU count)
+        """
+        for _, node, digest in self._calc_hashes(workers):
+            if node.exist_property('value'):
+                node.remove_property('value')
+            node.append(digest_prop('value', digest))
+
+    def verify_hashes(self, workers=None):
+        """ Verify the values of hash nodes of images
+
+        :param workers: The number of threads or shared Executor (default: CPU count)
+        :return: The list of HashResult(image, node, algo, valid)
+        """
+        results = []
+        for image, node, digest in self._calc_hashes(workers):
+            value = node.get_property('value')
+            results.append(HashResult(image.name, node.name, get_value(node, 'algo'),
+                                      value is not None and get_raw(value) == digest))
+        return results
+
     def to_its(self, rpath=None, tabsize=4):
         """ Export to ITS format
 
@@ -150,37 +300,36 @@ class FdtImage(object):
         # Crete ITS
         its = "/dts-v1/;\n"
         its += '\n'
-        its += root_node.to_dts(tabsize)
+        with span('serialize'):
+            its += root_node.to_dts(tabsize)
         return its, data
 
-    def to_itb(self, padding=0, align=None, size=None):
-        """ Export to ITB format
+    def _build_fdt(self, layout=None):
+        """ Build the FDT structure of image
 
-        :param padding:
-        :param align:
-        :param size:
-        :return:
+        :param layout: The list of (data-size, data-position) of images for external data, None for embedded data
+        :return: FDT object
         """
-        img_blob = bytes()
-        img_offset = padding
-
         fdt_obj = fdt.FDT()
         fdt_obj.add_item(fdt.PropWords("timestamp", int(time.time()) if self.time_stamp is None else self.time_stamp))
         fdt_obj.add_item(fdt.PropStrings("description", self.description))
 
         # Add images
         node = fdt.Node("images")
-        for image in self.img_info:
+        for n, image in enumerate(self.img_info):
             if image.name not in self.img_data:
                 raise Exception("export: data is None")
             cimg = image.copy()
-            data = self.img_data[image.name]
-            if padding:
-                img_blob += data
-                img_offset += len(data)
-                cimg.append(fdt.PropWords("data-size", len(data)))
-                cimg.append(fdt.PropWords("data-position", img_offset))
+            if layout is not None:
+                cimg.append(fdt.PropWords("data-size", layout[n][0]))
+                cimg.append(fdt.PropWords("data-position", layout[n][1]))
             else:
+                data = self.img_data[image.name]
+                if isinstance(data, FileData):
+                    data = data.read()
+                elif isinstance(data, memoryview):
+                    count_copy('FdtImage.to_itb', len(data))
+                    data = bytes(data)
                 cimg.append(fdt.PropBytes("data", data=data))
             node.append(cimg)
         fdt_obj.add_item(node)
@@ -194,28 +343,345 @@ class FdtImage(object):
                 node.append(cfg)
             fdt_obj.add_item(node)
 
-        # Generate FDT blob
-        itb = fdt_obj.to_dtb(17)
+        return fdt_obj
+
+    def _itb_layout(self, padding=0, align=None, size=None, workers=None):
+        """ Get the layout of ITB with external data. The data-size and data-position of all images are calculated
+            up front, the size of FDT structure doesn't depend on the values of data-position.
+
+        :param padding: The position of first image data (the FDT structure must fit before it), 0 for placing
+                        the data right behind the FDT structure
+        :param align: The alignment of image data positions (default: 4 bytes)
+        :param size: The min size of ITB, it's padded by zeros
+        :param workers: The number of threads for calculation of hash nodes
+        :return: The list of (position, data) parts of ITB, the zero gaps have data as int (the number of zeros)
+        """
+        align = align or 4
+        self.update_hashes(workers)
+        sizes = []
+        for image in self.img_info:
+            if image.name not in self.img_data:
+                raise Exception("export: data is None")
+            sizes.append(len(self.img_data[image.name]))
+
+        with span('serialize'):
+            fdt_size = len(self._build_fdt([(data_size, 0) for data_size in sizes]).to_dtb(17))
+        if padding and padding < fdt_size:
+            raise Exception("export: The FDT structure ({} bytes) doesn't fit into padding ({} bytes) !".format(
+                fdt_size, padding))
+
+        layout, offset = [], padding or fdt_size
+        for data_size in sizes:
+            offset += -offset % align
+            layout.append((data_size, offset))
+            offset += data_size
+        with span('serialize'):
+            itb = self._build_fdt(layout).to_dtb(17)
+        assert len(itb) == fdt_size
+
+        parts, end = [(0, itb)], len(itb)
+        for image, (data_size, position) in zip(self.img_info, layout):
+            if position > end:
+                parts.append((end, position - end))
+            parts.append((position, self.img_data[image.name]))
+            end = position + data_size
+        if size and size > end:
+            parts.append((end, size - end))
+        return parts
+
+    def to_itb(self, padding=0, align=None, size=None, workers=None):
+        """ Export to ITB format, the values of hash nodes are calculated
+
+        :param padding: The position of external data, 0 for data embedded into FDT structure
+        :param align: The alignment of external data positions (default: 4 bytes), for embedded data the alignment
+                      of ITB size
+        :param size: The min size of ITB, it's padded by zeros
+        :param workers: The number of threads for calculation of hash nodes (default: CPU count)
+        :return: The ITB as bytes
+        """
+        # The image data are copied into FDT blob (and into the blob of external data)
+        check_memory(2 * sum(len(data) for data in self.img_data.values()), "Export of FIT image into memory")
 
-        # ...
         if padding:
-            itb_align = padding - len(itb)
-            if itb_align < 0:
-                raise Exception()
-            if itb_align > 0:
-                itb += bytes([0] * itb_align)
-            itb += img_blob
+            parts = []
+            for _, data in self._itb_layout(padding, align, size, workers):
+                if isinstance(data, int):
+                    count_alloc('FdtImage.to_itb', data)
+                    data = bytes(data)
+                elif isinstance(data, FileData):
+                    data = data.read()
+                else:
+                    count_copy('FdtImage.to_itb', len(data))
+                parts.append(data)
+            return b''.join(parts)
+
+        # Generate FDT blob
+        self.update_hashes(workers)
+        fdt_obj = self._build_fdt()
+        with span('serialize'):
+            itb = fdt_obj.to_dtb(17)
+
+        itb_size = len(itb)
+        if align:
+            itb_size += -itb_size % align
+        if size and size > itb_size:
+            itb_size = size
+        if itb_size > len(itb):
+            count_alloc('FdtImage.to_itb', itb_size - len(itb))
+            itb += bytes(itb_size - len(itb))
 
         return itb
 
+    def write_itb(self, fileobj, padding=0, align=None, size=None, workers=None, chunk_size=CHUNK_SIZE):
+        """ Write to ITB format with external data. Only the small FDT structure is serialized in memory and
+            the image data are streamed from its source (e.g. FileData) behind it.
+
+        :param fileobj: The seekable file object opened for binary writing
+        :param padding: The position of first image data (the FDT structure must fit before it), 0 for placing
+                        the data right behind the FDT structure
+        :param align: The alignment of image data positions (default: 4 bytes), e.g. 4 kB page or erase block
+        :param size: The min size of ITB, it's padded by zeros
+        :param workers: The number of threads for calculation of hash nodes and concurrent positional writes
+                        of images (the file object must have a file descriptor)
+        :param chunk_size: The max size of data chunks read from input files
+        :return: The size of ITB
+        """
+        parts = self._itb_layout(padding, align, size, workers)
+        position, data = parts[-1]
+        end = position + (data if isinstance(data, int) else len(data))
+
+        def iter_part(data):
+            if isinstance(data, int):
+                # The zeros are generated in chunks, the padding can be large
+                zeros = bytes(min(data, chunk_size))
+                for index in range(0, data, chunk_size):
+                    yield zeros[:min(chunk_size, data - index)]
+            else:
+                yield from iter_chunks(data, chunk_size)
+
+        start = fileobj.tell()
+        if workers and workers != 1 and hasattr(os, 'pwrite'):
+            fileobj.flush()
+            fd = fileobj.fileno()
+
+            def pwrite(part):
+                position = start + part[0]
+                for chunk in iter_part(part[1]):
+                    chunk = memoryview(chunk)
+                    with span('write', len(chunk)):
+                        while chunk:
+                            written = os.pwrite(fd, chunk, position)
+                            position += written
+                            chunk = chunk[written:]
+
+            with get_executor(workers) as executor:
+                list(executor.map(pwrite, parts))
+            fileobj.seek(start + end)
+        else:
+            for _, data in parts:
+                for chunk in iter_part(data):
+                    with span('write', len(chunk)):
+                        fileobj.write(chunk)
+
+        return end
+
+    def to_itb_file(self, file, padding=0, align=None, size=None, workers=None, chunk_size=CHUNK_SIZE):
+        """ Save to ITB file with external data, see write_itb()
+
+        :param file: Path to output file
+        :param padding: The position of first image data, 0 for placing the data right behind the FDT structure
+        :param align: The alignment of image data positions (default: 4 bytes)
+        :param size: The min size of ITB, it's padded by zeros
+        :param workers: The number of threads for calculation of hash nodes and concurrent writes of images
+        :param chunk_size: The max size of data chunks read from input files
+        :return: The size of ITB
+        """
+        with open(file, 'wb') as f:
+            return self.write_itb(f, padding, align, size, workers, chunk_size)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Native FDT Walker
+# ----------------------------------------------------------------------------------------------------------------------
+
+# The tokens of FDT structure block
+FDT_BEGIN_NODE = 0x1
+FDT_END_NODE = 0x2
+FDT_PROP = 0x3
+FDT_NOP = 0x4
+FDT_END = 0x9
+
 
-def parse_its(text, root_dir=''):
+def _fdt_string(view, pos, end):
+    """ Get the NUL terminated string from FDT blob, it's searched in growing windows (the names are short)
+    :return: The string as bytes (without NUL)
+    """
+    window = 64
+    while True:
+        stop = min(pos + window, end)
+        chunk = bytes(view[pos:stop])
+        index = chunk.find(b'\0')
+        if index >= 0:
+            return chunk[:index]
+        if stop == end:
+            raise Exception("FDT: Unterminated string at offset %d !" % pos)
+        window *= 4
+
+
+def walk_fdt(data, offset=0):
+    """ Walk the structure block of flattened device tree directly in buffer. No objects are built and the values
+        of properties are zero-copy views, so the large data of images aren't decoded or copied.
+
+    :param data: The FDT blob as bytes, bytearray, memoryview or mmap
+    :param offset: The offset of FDT blob inside data
+    :return: Iterator of (path, props) in depth-first order, the props is OrderedDict of property names and raw
+             values (memoryview). The node is yielded before its sub-nodes, when all its properties are read.
+    """
+    view = memoryview(data).cast('B')
+    if len(view) - offset < FDT_HEADER_SIZE:
+        raise Exception("FDT: Too small size of input data !")
+    (magic, total_size, off_struct, off_strings, _, version, _, _, size_strings) = struct.unpack_from('>9L', view,
+                                                                                                   offset)
+    if magic != FDT_MAGIC:
+        raise Exception("FDT: Not a FDT blob !")
+    if len(view) - offset < total_size:
+        raise Exception("FDT: Too small size of input data !")
+
+    end = offset + total_size
+    strings_end = offset + off_strings + size_strings if version >= 3 else end
+    strings = bytes(view[offset + off_strings:strings_end])
+    names = {}
+
+    pos = offset + off_struct
+    stack = []
+    while True:
+        if pos + 4 > end:
+            raise Exception("FDT: Unexpected end of structure block !")
+        (token,) = struct.unpack_from('>L', view, pos)
+        pos += 4
+
+        if token == FDT_BEGIN_NODE:
+            name = _fdt_string(view, pos, end)
+            # The items are aligned to 4 bytes from start of blob
+            pos += len(name) + 1
+            pos += -(pos - offset) % 4
+            if stack and not stack[-1][2]:
+                stack[-1][2] = True
+                yield stack[-1][0], stack[-1][1]
+            if stack:
+                path = stack[-1][0].rstrip('/') + '/' + name.decode('utf-8', errors='replace')
+            else:
+                path = '/'
+            stack.append([path, OrderedDict(), False])
+
+        elif token == FDT_END_NODE:
+            if not stack:
+                raise Exception("FDT: Unexpected end of node at offset %d !" % (pos - 4))
+            path, props, done = stack.pop()
+            if not done:
+                yield path, props
+
+        elif token == FDT_PROP:
+            (size, name_offset) = struct.unpack_from('>2L', view, pos)
+            pos += 8
+            if version < 16 and size >= 8:
+                pos += -(pos - offset) % 8
+            if not stack or pos + size > end:
+                raise Exception("FDT: Invalid property at offset %d !" % pos)
+            if name_offset not in names:
+                index = strings.find(b'\0', name_offset)
+                names[name_offset] = strings[name_offset:index if index >= 0 else None].decode('utf-8', errors='replace')
+            stack[-1][1][names[name_offset]] = view[pos:pos + size]
+            pos += size
+            pos += -(pos - offset) % 4
+
+        elif token == FDT_NOP:
+            continue
+
+        elif token == FDT_END:
+            break
+
+        else:
+            raise Exception("FDT: Unknown token 0x%X at offset %d !" % (token, pos - 4))
+
+
+def _prop_string(value):
+    """ Decode the raw value of string property """
+    return bytes(value).split(b'\0', 1)[0].decode('utf-8', errors='replace')
+
+
+def _parse_fit_native(data, offset=0):
+    """ Create FIT image by native FDT walker, only the properties of images and configs are decoded.
+        The embedded and external data of images are zero-copy views into data.
+    """
+    view = memoryview(data).cast('B')
+    fim_obj = FdtImage()
+    fim_obj.time_stamp = None
+    nodes, configs, has_images = {}, [], False
+
+    with span('parse'):
+        for path, props in walk_fdt(view, offset):
+            if path == '/':
+                if 'timestamp' in props:
+                    (fim_obj.time_stamp,) = struct.unpack_from('>L', props['timestamp'])
+                if 'description' in props:
+                    fim_obj.description = _prop_string(props['description'])
+                continue
+            if path == '/images':
+                has_images = True
+                continue
+            if path == '/configurations':
+                if 'default' in props:
+                    fim_obj.def_config = _prop_string(props['default'])
+                continue
+
+            parent, name = path.rsplit('/', 1)
+            if parent not in ('/images', '/configurations') and parent not in nodes:
+                continue
+
+            node = fdt.Node(name)
+            img_data = props.pop('data', None) if parent == '/images' else None
+            if parent == '/images' and img_data is None:
+                if 'data-size' not in props or 'data-position' not in props:
+                    raise Exception("parse_itb: The data of image %s are not defined" % name)
+                (data_size,) = struct.unpack_from('>L', props.pop('data-size'))
+                (data_offset,) = struct.unpack_from('>L', props.pop('data-position'))
+                if offset + data_offset + data_size > len(view):
+                    raise Exception("parse_itb: The data of image %s are out of range" % name)
+                img_data = view[offset + data_offset:offset + data_offset + data_size]
+            for prop_name, value in props.items():
+                node.append(fdt.new_property(prop_name, bytes(value)))
+
+            nodes[path] = node
+            if parent == '/images':
+                fim_obj.add_img(node, img_data)
+            elif parent == '/configurations':
+                configs.append(node)
+            else:
+                nodes[parent].append(node)
+
+    if not has_images or not fim_obj.img_info:
+        raise Exception("parse_itb: images not defined")
+
+    # The configs are validated when all images are known
+    for cfg in configs:
+        fim_obj.add_cfg(cfg, True)
+
+    return fim_obj
+
+
+@traced('parse')
+def parse_its(text, root_dir='', lazy=False):
     """ Parse ITS file
 
     :param text:
     :param root_dir:
+    :param lazy: The /incbin/ data of images aren't read, they are referenced as FileData (see write_itb)
     :return:
     """
+    if lazy:
+        # The /incbin/ is replaced by string with the file reference, so the FDT parser doesn't read the file
+        text = INCBIN_PATTERN.sub(lambda m: '{}"{}{}"'.format(m.group(1), INCBIN_REF, m.group(2).replace('"', '')), text)
     its_obj = fdt.parse_dts(text, root_dir)
     # ...
     fim_obj = FdtImage()
@@ -228,7 +694,14 @@ def parse_its(text, root_dir=''):
     if node is None:
         raise Exception("parse_its: images not defined")
     for img in node.nodes:
-        img_data = get_data(img)
+        prop = img.get_property("data")
+        if lazy and isinstance(prop, fdt.PropStrings) and prop[0].startswith(INCBIN_REF):
+            args = [arg.strip() for arg in prop[0][len(INCBIN_REF):].split(',')]
+            img_data = FileData(os.path.join(root_dir, args[0]),
+                                int(args[1], 0) if len(args) > 1 else 0,
+                                int(args[2], 0) if len(args) > 2 and int(args[2], 0) > 0 else None)
+        else:
+            img_data = get_data(img)
         img.remove_property("data")
         fim_obj.add_img(img, img_data)
 
@@ -244,15 +717,103 @@ def parse_its(text, root_dir=''):
     return fim_obj
 
 
-def parse_itb(data, offset=0):
+def check_hashes(fim_obj, workers=None):
+    """ Verify the hash nodes of FIT image, raise an exception if some value doesn't match
+
+    :param fim_obj: FdtImage object
+    :param workers: The number of threads (default: CPU count)
+    :return: FdtImage object
+    """
+    for result in fim_obj.verify_hashes(workers):
+        if not result.valid:
+            raise Exception("parse_itb: The {} hash of image {} ({}) doesn't match !".format(
+                result.algo, result.image, result.node))
+    return fim_obj
+
+
+def parse_itb(data, offset=0, native=False, verify=False):
     """ Parse ITB data-blob
 
-    :param data:
-    :param offset:
-    :return:
+    :param data: The data as bytes, bytearray, memoryview or mmap (the external data are sliced as views from
+                 the last two)
+    :param offset: The offset of ITB inside data
+    :param native: Use the native FDT walker (faster, for read-only operations), the data of images are views
+    :param verify: Verify the hash nodes of images (in parallel threads)
+    :return: FdtImage object
+    """
+    if len(data) - offset < FDT_HEADER_SIZE:
+        raise Exception("parse_itb: Too small size of input data !")
+    (magic, fdt_size) = struct.unpack_from('>2L', data, offset)
+    if magic != FDT_MAGIC:
+        raise Exception("parse_itb: Not a FDT blob !")
+    if native:
+        fim_obj = _parse_fit_native(data, offset)
+        return check_hashes(fim_obj) if verify else fim_obj
+
+    # Only the FDT structure is passed to parser, the embedded data of images are copied out of it
+    check_memory(fdt_size, "Parsing of FIT image")
+    blob = data
+    if offset or len(data) != fdt_size or not isinstance(data, (bytes, bytearray)):
+        count_copy('parse_itb', fdt_size)
+        blob = bytes(memoryview(data)[offset:offset + fdt_size])
+    with span('parse', fdt_size):
+        fdt_obj = fdt.parse_dtb(blob)
+    # The slice of mmap is a copy, the external data are sliced from its view
+    fim_obj = parse_fit(fdt_obj, memoryview(data) if isinstance(data, mmap.mmap) else data, offset)
+    return check_hashes(fim_obj) if verify else fim_obj
+
+
+def parse_itb_file(file, offset=0, native=False, verify=False):
+    """ Parse ITB file without loading the external data of images, only the FDT structure is read.
+        The external data are read-only views over the memory mapped file, they are read at first access.
+
+    :param file: Path to ITB file
+    :param offset: The offset of ITB inside file
+    :param native: Use the native FDT walker over the mapped file (faster, for read-only operations), the embedded
+                   data of images aren't read too
+    :param verify: Verify the hash nodes of images, the data are hashed from mapped file in parallel threads
+    :return: FdtImage object
+    """
+    if native:
+        if os.path.getsize(file) == 0:
+            raise Exception("parse_itb: Empty file: %s" % file)
+        with open(file, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return parse_itb(data, offset, native=True, verify=verify)
+
+    with open(file, 'rb') as f:
+        f.seek(offset)
+        with span('read', FDT_HEADER_SIZE):
+            header = f.read(FDT_HEADER_SIZE)
+        if len(header) < FDT_HEADER_SIZE:
+            raise Exception("parse_itb: Too small size of input file: %s" % file)
+        (magic, fdt_size) = struct.unpack_from('>2L', header)
+        if magic != FDT_MAGIC:
+            raise Exception("parse_itb: Not a FDT blob: %s" % file)
+
+        check_memory(fdt_size, "Parsing of FIT image")
+        f.seek(offset)
+        with span('read', fdt_size):
+            blob = f.read(fdt_size)
+        if len(blob) < fdt_size:
+            raise Exception("parse_itb: Unexpected end of file: %s" % file)
+        with span('parse', fdt_size):
+            fdt_obj = fdt.parse_dtb(blob)
+
+        data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    fim_obj = parse_fit(fdt_obj, data, offset)
+    return check_hashes(fim_obj) if verify else fim_obj
+
+
+def parse_fit(fdt_obj, data=None, offset=0):
+    """ Create FIT image from parsed ITB data-blob
+
+    :param fdt_obj: The parsed FDT object
+    :param data: The ITB data-blob, the external data of images are sliced from it (a view is not copied)
+    :param offset: The offset of ITB data-blob
+    :return: FdtImage object
     """
-    fdt_obj = fdt.parse_dtb(data, offset)
-    # ...
     fim_obj = FdtImage()
     fim_obj.time_stamp = get_value(fdt_obj, "timestamp")
     fim_obj.description = get_value(fdt_obj, "description", "")
@@ -263,12 +824,16 @@ def parse_itb(data, offset=0):
         raise Exception("parse_itb: images not defined")
     for img in node.nodes:
         if img.exist_property("data"):
+            # The embedded data were copied out of blob by FDT parser
             img_data = get_data(img)
+            count_copy('parse_fit', len(img_data))
             img.remove_property("data")
-        elif img.exist_property("data-size") and img.exist_property("data-position"):
+        elif data is not None and img.exist_property("data-size") and img.exist_property("data-position"):
             data_size = get_value(img, "data-size")
             data_offset = get_value(img, "data-position")
             img_data = data[offset + data_offset: offset + data_offset + data_size]
+            if not isinstance(img_data, memoryview):
+                count_copy('parse_fit', len(img_data))
             img.remove_property("data-size")
             img.remove_property("data-position")
         else:
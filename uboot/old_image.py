@@ -12,22 +12,188 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import mmap
 import time
-import binascii
-from struct import pack, unpack_from, calcsize
+import zlib
+import hashlib
+from struct import Struct, pack, unpack_from
+from collections import namedtuple
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 
-from .common import EnumArchType, EnumOsType, EnumImageType, EnumCompressionType
+from .common import EnumArchType, EnumOsType, EnumImageType, EnumCompressionType, FileData, CHUNK_SIZE, iter_chunks, \
+                    check_memory, get_executor, pool_task, in_pool_task
+from .compression import READ_SPEED, select_codec, iter_compress
+from .tracing import span, traced, count_copy, count_alloc
 
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Helper methods
 # ----------------------------------------------------------------------------------------------------------------------
-def CRC32(data):
+# The min size of data hashed in parallel threads and the min size of one hashed chunk
+CRC32_PARALLEL_THRESHOLD = 16 * 1024 * 1024
+CRC32_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def CRC32(data, value=0, workers=None):
     """ Help function for 32bit CRC calculation
     :param data: Tha data blob as byte array
+    :param value: The CRC of preceding data
+    :param workers: The number of threads (or shared Executor) for large data (default: CPU count, 1 inside the task
+                    of other pool), 1 for serial
     :return: CRC Value
     """
-    return binascii.crc32(data) & 0xFFFFFFFF
+    size = len(data)
+    if workers is None:
+        workers = 1 if in_pool_task() else os.cpu_count() or 1
+    with span('checksum', size):
+        if size < CRC32_PARALLEL_THRESHOLD or workers == 1:
+            return zlib.crc32(data, value) & 0xFFFFFFFF
+
+        # zlib.crc32 releases the GIL for large data, so the chunks are hashed in parallel threads
+        # and their CRCs are merged by crc32_combine()
+        view = memoryview(data).cast('B')
+        count = workers if isinstance(workers, int) else os.cpu_count() or 1
+        chunk_size = max(CRC32_CHUNK_SIZE, -(-size // (count * 4)))
+        offsets = range(0, size, chunk_size)
+        with get_executor(workers) as executor:
+            crcs = list(executor.map(lambda offset: zlib.crc32(view[offset:offset + chunk_size]), offsets))
+
+        crc = value
+        for offset, chunk_crc in zip(offsets, crcs):
+            crc = crc32_combine(crc, chunk_crc, min(chunk_size, size - offset))
+        return crc & 0xFFFFFFFF
+
+
+# The operators (32x32 GF(2) matrices) appending 2^n zero bytes to CRC32, they are created at first use
+_CRC32_ZEROS = None
+
+
+def _gf2_matrix_times(mat, vec):
+    total = 0
+    for row in mat:
+        if not vec:
+            break
+        if vec & 1:
+            total ^= row
+        vec >>= 1
+    return total
+
+
+def _gf2_matrix_square(mat):
+    return [_gf2_matrix_times(mat, row) for row in mat]
+
+
+def _crc32_zeros(crc, length):
+    """ Get the CRC32 extended by <length> zero bytes without processing them, in O(log(length)) """
+    global _CRC32_ZEROS
+    if _CRC32_ZEROS is None:
+        # The operator for one zero bit (CRC-32 polynomial) squared up to one zero byte, then 2, 4, 8, ... bytes
+        mat = [0xEDB88320] + [1 << n for n in range(31)]
+        for _ in range(3):
+            mat = _gf2_matrix_square(mat)
+        operators = [mat]
+        for _ in range(63):
+            operators.append(_gf2_matrix_square(operators[-1]))
+        _CRC32_ZEROS = operators
+
+    n = 0
+    while length:
+        if length & 1:
+            crc = _gf2_matrix_times(_CRC32_ZEROS[n], crc)
+        length >>= 1
+        n += 1
+    return crc
+
+
+def crc32_combine(crc1, crc2, len2):
+    """ Help function for combining CRC32 of two data blocks (like zlib crc32_combine)
+    :param crc1: The CRC32 of first block
+    :param crc2: The CRC32 of second block
+    :param len2: The length of second block
+    :return: The CRC32 of concatenated blocks
+    """
+    return (_crc32_zeros(crc1, len2) ^ crc2) & 0xFFFFFFFF
+
+
+@traced('checksum')
+def crc32_patch(crc, old, new, tail):
+    """ Help function for updating CRC32 of data with replaced range, it costs about the size of the range
+    :param crc: The CRC32 of original data
+    :param old: The original content of replaced range
+    :param new: The new content of replaced range (the same size)
+    :param tail: The length of data behind replaced range
+    :return: The CRC32 of patched data
+    """
+    size = len(new)
+    assert len(old) == size, "CRC32: The replaced range must keep its size"
+    # CRC32 is affine, the difference of CRCs is the linear CRC of XOR-ed data shifted by the tail
+    count_alloc('crc32_patch', 2 * size)
+    delta = (int.from_bytes(old, 'big') ^ int.from_bytes(new, 'big')).to_bytes(size, 'big')
+    diff = zlib.crc32(delta) ^ zlib.crc32(bytes(size))
+    return (crc ^ _crc32_zeros(diff, tail)) & 0xFFFFFFFF
+
+
+def is_mutable(data):
+    """ Help function for checking if the data can be modified in place (bytearray, writable memoryview or mmap)
+    :param data: The data blob, FileData or iterable of chunks
+    :return: True if the data are a writable buffer
+    """
+    if isinstance(data, (bytes, FileData)):
+        return False
+    try:
+        with memoryview(data) as view:
+            return not view.readonly
+    except TypeError:
+        return False
+
+
+def get_slice(data, start, end):
+    """ Help function for slicing of input data
+    :param data: The data blob as bytes, bytearray, memoryview or mmap
+    :param start: The start offset
+    :param end: The end offset
+    :return: A zero-copy view if data is a memoryview or mmap, otherwise a copy of the slice
+    """
+    if isinstance(data, (memoryview, mmap.mmap)):
+        return memoryview(data)[start:end]
+    check_memory(max(min(end, len(data)) - start, 0), "Copy of image data")
+    chunk = data[start:end]
+    count_copy('get_slice', len(chunk))
+    return chunk
+
+
+def find_bytes(data, sub, start=0, end=None):
+    """ Help function for searching a byte sequence inside data
+    :param data: The data blob as bytes, bytearray, memoryview or mmap
+    :param sub: The searched byte sequence
+    :param start: The start offset
+    :param end: The end offset (the sequence must fit before it)
+    :return: The offset of first occurrence or -1
+    """
+    end = len(data) if end is None else min(end, len(data))
+    if hasattr(data, 'find'):
+        return data.find(sub, start, end)
+
+    # memoryview has no find(), the sequence at start offset is compared in place (the usual case of parsing)
+    view = memoryview(data)
+    if start + len(sub) <= end and view[start:start + len(sub)] == sub:
+        return start
+
+    # otherwise search it in bounded overlapping chunks, they grow up so the near sequence is found with small copy
+    chunk_size = 4096
+    while start < end:
+        stop = min(start + chunk_size + len(sub) - 1, end)
+        count_copy('find_bytes', stop - start)
+        index = bytes(view[start:stop]).find(sub)
+        if index >= 0:
+            return start + index
+        start += chunk_size
+        chunk_size = min(chunk_size * 2, 1 << 20)
+    return -1
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 
 
@@ -36,24 +202,42 @@ def CRC32(data):
 # ----------------------------------------------------------------------------------------------------------------------
 class Header(object):
     MAGIC_NUMBER = 0x27051956
+    MAGIC_BYTES = pack('!L', MAGIC_NUMBER)
     FORMAT = '!7L4B32s'      # (Big-endian, 7 ULONGS, 4 UCHARs, 32-byte string)
-    SIZE = calcsize(FORMAT)  # Should be 64-bytes
+    STRUCT = Struct(FORMAT)
+    SIZE = STRUCT.size       # Should be 64-bytes
+    # The attributes packed into header, a change of any of them drops the cached header
+    FIELDS = frozenset(('magic_number', 'time_stamp', 'data_size', 'load_address', 'entry_address', 'data_crc',
+                        '_os_type', '_arch_type', '_image_type', '_compression', '_name'))
 
     @property
     def header_crc(self):
-        return  CRC32(pack(self.FORMAT,
-                           self.magic_number,
-                           0,
-                           self.time_stamp,
-                           self.data_size,
-                           self.load_address,
-                           self.entry_address,
-                           self.data_crc,
-                           self.os_type,
-                           self.arch_type,
-                           self.image_type,
-                           self.compression,
-                           self.name.encode('utf-8')))
+        self._pack()
+        return self._header_crc
+
+    def __setattr__(self, name, value):
+        if name in self.FIELDS and self.__dict__.get(name) != value:
+            self.__dict__['_packed'] = None
+        object.__setattr__(self, name, value)
+
+    def _pack(self):
+        """ Get the packed header, it's cached until some field is changed """
+        if self._packed is None:
+            raw = self.STRUCT.pack(self.magic_number,
+                                   0,
+                                   self.time_stamp,
+                                   self.data_size,
+                                   self.load_address,
+                                   self.entry_address,
+                                   self.data_crc,
+                                   self.os_type,
+                                   self.arch_type,
+                                   self.image_type,
+                                   self.compression,
+                                   self.name.encode('utf-8'))
+            self._header_crc = CRC32(raw)
+            self._packed = raw[:4] + pack('!L', self._header_crc) + raw[8:]
+        return self._packed
 
     @property
     def os_type(self):
@@ -115,6 +299,8 @@ class Header(object):
         :param compress: Image compression (COMPRESSType Enum)
         :param name:     Image name (max: 32 chars)
         """
+        self._packed = None
+        self._header_crc = 0
         self.magic_number = self.MAGIC_NUMBER  # U-Boot Default Value is 0x27051956
         self.time_stamp = int(time.time())
         self.data_size = 0
@@ -126,7 +312,19 @@ class Header(object):
         self._image_type = EnumImageType.STANDALONE
         self._compression = EnumCompressionType.NONE
         self._name = ''
+        self.update(**kwargs)
 
+    def update(self, **kwargs):
+        """ Update the header fields
+        :param laddr:    Load address
+        :param eaddr:    Entry point address
+        :param arch:     Architecture (ARCHType Enum)
+        :param os:       Operating system (OSType Enum)
+        :param image:    Image type (IMGType Enum)
+        :param compress: Image compression (COMPRESSType Enum)
+        :param name:     Image name (max: 32 chars)
+        :param time:     Time stamp (seconds since epoch)
+        """
         if 'laddr' in kwargs:
             try:
                 self.load_address = int(kwargs['laddr'], 0) if isinstance(kwargs['laddr'], str) else int(kwargs['laddr'])
@@ -151,6 +349,8 @@ class Header(object):
             self.compression = val if isinstance(val, int) else EnumCompressionType[val]
         if 'name' in kwargs and kwargs['name'] is not None:
             self.name = kwargs['name']
+        if 'time' in kwargs and kwargs['time'] is not None:
+            self.time_stamp = int(kwargs['time'])
 
     def __len__(self):
         return self.size
@@ -167,7 +367,7 @@ class Header(object):
     def __eq__(self, obj):
         if not isinstance(obj, Header):
             return False
-        if self.header_crc != obj.header_crc:
+        if self._pack() != obj._pack():
             return False
         return True
 
@@ -184,26 +384,14 @@ class Header(object):
         return msg
 
     def export(self):
-        return pack(self.FORMAT,
-                    self.magic_number,
-                    self.header_crc,
-                    self.time_stamp,
-                    self.data_size,
-                    self.load_address,
-                    self.entry_address,
-                    self.data_crc,
-                    self.os_type,
-                    self.arch_type,
-                    self.image_type,
-                    self.compression,
-                    self.name.encode('utf-8'))
+        return self._pack()
 
     @classmethod
     def parse(cls, data, offset=0, ignore_crc=False):
-        if len(data) < cls.SIZE:
+        if (len(data) - offset) < cls.SIZE:
             raise Exception("Header: Too small size of input data !")
 
-        val = unpack_from(cls.FORMAT, data, offset)
+        val = cls.STRUCT.unpack_from(data, offset)
         header = cls()
 
         header.magic_number = val[0]
@@ -227,6 +415,20 @@ class Header(object):
                 raise Exception(f"Header: Uncorrect CRC of input data ! {hex(header_crc)} != {hex(header.header_crc)}")
 
         return header
+
+    @classmethod
+    def check_crc(cls, data, offset=0):
+        """ Check the CRC of raw header without decoding and copying it
+        :param data: The raw data as bytes, bytearray, memoryview or mmap
+        :param offset: The offset of header
+        :return: True if the header CRC is valid
+        """
+        view = memoryview(data)
+        (header_crc,) = unpack_from('!L', view, offset + 4)
+        crc = zlib.crc32(view[offset:offset + 4])
+        crc = zlib.crc32(b'\0' * 4, crc)
+        crc = zlib.crc32(view[offset + 8:offset + cls.SIZE], crc)
+        return header_crc == crc & 0xFFFFFFFF
 # ----------------------------------------------------------------------------------------------------------------------
 
 
@@ -234,8 +436,18 @@ class Header(object):
 # UBoot Image Classes
 # ----------------------------------------------------------------------------------------------------------------------
 class BaseImage(object):
+    # The hashlib algorithm used for fingerprint of image data (e.g. 'sha256'), None for data CRC from header
+    FINGERPRINT_HASH = None
+
     def __init__(self, **kwargs):
         self.header = Header(**kwargs)
+        # The generation of image content, it's incremented by every modification
+        self._gen = 0
+        self._crc_cache = None
+        self._export_cache = None
+        self._fp_cache = None
+        # The raw data and CRC of lazy parsed image, they are checked at first access of content
+        self._pending_crc = None
 
     def __str__(self):
         return self.info()
@@ -243,24 +455,201 @@ class BaseImage(object):
     def __repr__(self):
         return self.info()
 
+    def __eq__(self, obj):
+        if not isinstance(obj, BaseImage):
+            return False
+        if self.fingerprint() != obj.fingerprint():
+            return False
+        return True
+
     def __ne__(self, obj):
         return not self.__eq__(obj)
 
+    def __hash__(self):
+        return hash(self.fingerprint())
+
     def info(self):
-        self.export()
+        self._update_header()
+        return self._info()
+
+    def _info(self):
+        """ Get the image info in readable format, the header must be updated before """
         return self.header.info()
 
+    def fingerprint(self):
+        """ Get the content fingerprint of image, it's used for comparison and hashing of images.
+            It consists of header fields (without time stamp) and the size and CRC of data (or the hash
+            of data if FINGERPRINT_HASH is defined). The value is cached until the image is modified.
+            :return: The fingerprint as tuple
+        """
+        header = self.header
+        fields = (header.load_address, header.entry_address, header.os_type, header.arch_type,
+                  header.image_type, header.compression, header.name)
+        state = self._state()
+        if state is None:
+            return fields, self._data_fingerprint()
+        key = (state, fields, self.FINGERPRINT_HASH)
+        if self._fp_cache is None or self._fp_cache[0] != key:
+            self._fp_cache = (key, (fields, self._data_fingerprint()))
+        return self._fp_cache[1]
+
+    def _data_fingerprint(self):
+        """ Get the fingerprint of image data """
+        if self.FINGERPRINT_HASH is None:
+            self._update_header()
+            return self.header.data_size, self.header.data_crc
+
+        size, digest = 0, hashlib.new(self.FINGERPRINT_HASH)
+        for chunk in self._iter_payload():
+            digest.update(chunk)
+            size += len(chunk)
+        return size, digest.digest()
+
+    def invalidate(self):
+        """ Drop the cached data size, CRC and exported image. The content which can be modified outside of image
+            (e.g. a bytearray passed by caller) isn't cached at all, so it's needed for custom subclasses only.
+        """
+        self._gen += 1
+        self._export_cache = None
+
+    def _state(self):
+        """ Get the key identifying current content of image (without header), None if the content can be modified
+            without notice of image (e.g. a bytearray shared with caller), so nothing can be cached
+        """
+        return self._gen
+
+    def _verify_data(self):
+        """ Check the data CRC deferred by parsing (see MultiImage.__iter__), it's done at first access of data """
+        if self._pending_crc is None:
+            return
+        data, crc = self._pending_crc
+        if CRC32(data) != crc:
+            raise Exception("Image: Uncorrect CRC of input data ")
+        self._pending_crc = None
+
+    def _mark_updated(self):
+        """ Mark the data size and CRC inside header as valid for current content """
+        state = self._state()
+        self._crc_cache = None if state is None else (state, (self.header.data_size, self.header.data_crc))
+
+    def _iter_payload(self, chunk_size=CHUNK_SIZE, keep=True):
+        """ Get the image data (without header) as iterator of chunks, the header must be updated before
+            :param chunk_size: The max size of data chunks read from input files
+            :param keep: Keep the one-shot data (e.g. generator) for later use, False if they are only streamed
+        """
+        raise NotImplementedError()
+
+    def _is_updated(self):
+        """ Check if the data size and CRC inside header are valid for current content """
+        state = self._state()
+        return state is not None and self._crc_cache is not None and self._crc_cache[0] == state
+
+    def _calc_crc(self):
+        """ Calculate the size and CRC of image data, the header must be updated before """
+        size, crc = 0, 0
+        for chunk in self._iter_payload():
+            crc = CRC32(chunk, crc)
+            size += len(chunk)
+        return size, crc
+
+    def _update_header(self):
+        """ Update the data size and CRC inside header, the values are cached until the content is modified """
+        self._verify_data()
+        if self._is_updated():
+            self.header.data_size, self.header.data_crc = self._crc_cache[1]
+            return
+
+        self.header.data_size, self.header.data_crc = self._calc_crc()
+        self._mark_updated()
+
+    def _export(self):
+        """ Export the image into byte array, the header must be updated before """
+        raise NotImplementedError()
+
     def parse(self, data, offset=0):
         raise NotImplementedError()
 
     def export(self):
-        raise NotImplementedError()
+        """ Export the image into byte array, the result is cached until the image is modified. """
+        self._update_header()
+        return self._export_cached()
+
+    def _export_cached(self):
+        """ Export the image into byte array or get it from cache, the header must be updated before """
+        state = self._state()
+        if state is None:
+            # The shared mutable data are exported every time, they can be changed by caller
+            check_memory(self.header.size + self.header.data_size, "Export of image into memory")
+            with span('serialize'):
+                return self._export()
+
+        key = (state, self.header.export())
+        if self._export_cache is None or self._export_cache[0] != key:
+            # The image is exported into bytes, use export_to() or save() for the data over memory budget
+            check_memory(self.header.size + self.header.data_size, "Export of image into memory")
+            with span('serialize'):
+                self._export_cache = (key, self._export())
+        return self._export_cache[1]
+
+    def export_to(self, fileobj, chunk_size=CHUNK_SIZE):
+        """ Export the image into file object without loading the data into memory.
+            :param fileobj: The seekable file object opened for binary writing
+            :param chunk_size: The max size of data chunks read from input files
+        """
+        # Write the placeholder of header, the data size and CRC are known after the data are streamed
+        start = fileobj.tell()
+        fileobj.write(bytes(self.header.size))
+
+        size, crc = 0, 0
+        for chunk in self._iter_payload(chunk_size, keep=False):
+            with span('write', len(chunk)):
+                fileobj.write(chunk)
+            crc = CRC32(chunk, crc)
+            size += len(chunk)
+
+        if size == 0:
+            raise Exception("Image: No data to export !")
+
+        self.header.data_size = size
+        self.header.data_crc = crc
+        self._mark_updated()
+
+        with span('write', self.header.size):
+            end = fileobj.tell()
+            fileobj.seek(start)
+            fileobj.write(self.header.export())
+            fileobj.seek(end)
+
+    def save(self, file, chunk_size=CHUNK_SIZE, **kwargs):
+        """ Save the image into file.
+            :param file: Path to output file
+            :param chunk_size: The max size of data chunks read from input files
+            :param kwargs: The other arguments of export_to() method
+        """
+        with open(file, 'wb') as f:
+            self.export_to(f, chunk_size, **kwargs)
 
 
 class StdImage(BaseImage):
+
+    @property
+    def data(self):
+        self._verify_data()
+        # The returned buffer can be modified by caller, so a mutable one is shared from now
+        self._private = False
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        # The mutable data are owned by caller, the size and CRC can't be cached
+        self._private = False
+        self._pending_crc = None
+        self.invalidate()
+
     def __init__(self, data=None, **kwargs):
         """ Image Constructor
-        :param data:     Image content as byte array
+        :param data:     Image content as byte array or FileData
         :param laddr:    Load address
         :param eaddr:    Entry point address
         :param arch:     Architecture (ARCHType Enum)
@@ -272,59 +661,150 @@ class StdImage(BaseImage):
         super().__init__(**kwargs)
         self.data = data if data else bytearray()
 
-    def __eq__(self, obj):
-        if not isinstance(obj, StdImage):
-            return False
-        if self.__len__() != len(obj):
-            return False
-        if self.data != obj.data:
-            return False
-        return True
-
     def __len__(self):
-        return len(self.data)
+        return len(self._data)
 
     def __iter__(self):
-        return iter(self.data)
+        self._verify_data()
+        return iter(self._data)
 
     def __getitem__(self, key):
-        return self.data[key]
+        self._verify_data()
+        return self._data[key]
 
     def __setitem__(self, key, value):
-        self.data[key] = value
+        self._verify_data()
+        # The replaced range, if it keeps the data size the CRC is updated from this range only
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self._data))
+            same_size = hasattr(value, '__len__') and len(value) == max(stop - start, 0)
+            patch = bytes(value) if step == 1 and same_size else None
+            if patch is not None:
+                count_copy('StdImage.setitem', len(patch))
+        else:
+            start = key + len(self._data) if key < 0 else key
+            stop = start + 1
+            patch = bytes((value,))
+
+        updated = patch is not None and self._is_updated()
+        if updated:
+            old = bytes(self._data[start:stop])
+            count_copy('StdImage.setitem', len(old))
+
+        # Data parsed from memoryview or mmap are read-only views, make a private copy at first modification
+        if isinstance(self._data, FileData):
+            self._data = bytearray(self._data.read())
+            self._private = True
+            count_copy('StdImage.setitem', len(self._data))
+        elif not isinstance(self._data, bytearray):
+            check_memory(len(self._data), "Modification of image data")
+            self._data = bytearray(self._data)
+            self._private = True
+            count_copy('StdImage.setitem', len(self._data))
+        self._data[key] = value
+        self.invalidate()
+
+        if updated:
+            size, crc = self._crc_cache[1]
+            self.header.data_size = size
+            self.header.data_crc = crc32_patch(crc, old, patch, size - stop)
+            self._mark_updated()
+
+    def patch(self, offset, data):
+        """ Replace the part of image data, the data CRC is updated from the replaced range only
+        :param offset: The offset inside image data
+        :param data: The new content of replaced range
+        """
+        if offset < 0 or offset + len(data) > len(self._data):
+            raise Exception("Image: Patch out of data range !")
+        self[offset:offset + len(data)] = data
 
-    def info(self):
-        msg  = super().info()
-        msg += "Content:       Binary Blob ({0:d} Bytes)\n".format(len(self.data))
+    def _info(self):
+        msg  = super()._info()
+        msg += "Content:       Binary Blob ({0:d} Bytes)\n".format(self.header.data_size)
         return msg
 
-    def export(self):
-        """ Export the image into byte array. """
-        if len(self.data) == 0:
+    def _state(self):
+        if not self._private and is_mutable(self._data):
+            return None
+        return self._gen
+
+    def _verify_data(self):
+        if self._pending_crc is not None:
+            super()._verify_data()
+            # The data are verified, so the header doesn't need to be updated
+            self._mark_updated()
+
+    def _iter_payload(self, chunk_size=CHUNK_SIZE, keep=True):
+        self._verify_data()
+        if self._data is None:
+            raise Exception("Image: The data iterator was already consumed by export !")
+        if isinstance(self._data, Iterator):
+            return self._consume_data(keep)
+        return iter_chunks(self._data, chunk_size)
+
+    def _consume_data(self, keep):
+        """ Read the one-shot data iterator (e.g. generator), the chunks are kept in memory for next use.
+            Without keeping (streaming into file) the data can't be read again, only the header is valid.
+        """
+        data, buffer = self._data, bytearray()
+        self._data = None
+        for chunk in data:
+            if keep:
+                check_memory(len(buffer) + len(chunk), "Buffering of image data")
+                buffer += chunk
+            yield chunk
+        if keep:
+            count_copy('StdImage.buffer', len(buffer))
+            self._data = buffer
+            self._private = True
+
+    def _export(self):
+        if len(self._data) == 0:
             raise Exception("Image: No data to export !")
 
-        self.header.data_size = len(self.data)
-        self.header.data_crc = CRC32(self.data)
+        data = self._data.read() if isinstance(self._data, FileData) else self._data
+        count_copy('StdImage.export', len(data))
+        return self.header.export() + data
 
-        return self.header.export() + self.data
+    def export_to(self, fileobj, chunk_size=CHUNK_SIZE):
+        """ Export the image into file object without loading the data into memory.
+            The data can be also an iterable of bytes chunks (e.g. generator), it's consumed only once. If it wasn't
+            read before (e.g. by info() or export()), it's streamed without buffering and can't be exported again.
+            :param fileobj: The seekable file object opened for binary writing
+            :param chunk_size: The max size of data chunks read from input files
+        """
+        if hasattr(self._data, '__len__') and len(self._data) == 0:
+            raise Exception("Image: No data to export !")
+
+        super().export_to(fileobj, chunk_size)
 
     @classmethod
-    def parse(cls, data, offset=0, ignore_crc=False):
+    def parse(cls, data, offset=0, ignore_crc=False, defer_crc=False):
         """ Load the image from byte array.
             :param data:   The raw image as byte array
             :param offset: The offset of input data
             :param ignore_crc: ignore crc errors
+            :param defer_crc: Check the data CRC at first access of data (the header CRC is checked immediately)
         """
         img = cls()
         img.header = Header.parse(data, offset, ignore_crc)
         offset += img.header.size
-        if len(data[offset:]) < img.header.data_size:
+        if (len(data) - offset) < img.header.data_size:
             raise Exception("Image: Too small size of input data !")
 
-        img.data = data[offset:offset + img.header.data_size]
-        if CRC32(img.data) != img.header.data_crc:
+        img.data = get_slice(data, offset, offset + img.header.data_size)
+        # The slice of bytes or bytearray is a private copy, the views share the input data
+        img._private = not isinstance(data, (memoryview, mmap.mmap))
+        if defer_crc:
+            if not ignore_crc:
+                img._pending_crc = (img._data, img.header.data_crc)
+        elif CRC32(img._data) != img.header.data_crc:
             if not ignore_crc:
                 raise Exception("Image: Uncorrect CRC of input data ")
+        else:
+            # The data are verified, so the header doesn't need to be updated
+            img._mark_updated()
 
         return img
 
@@ -344,25 +824,18 @@ class FwImage(StdImage):
         # Set The Image Type to Firmware
         self.header.image_type = EnumImageType.FIRMWARE
 
-        def __eq__(self, obj):
-            if not isinstance(obj, FwImage):
-                return False
-            if self.__len__() != len(obj):
-                return False
-            if self.data != obj.data:
-                return False
-            return True
-
 
 class ScriptImage(BaseImage):
 
     @property
     def cmds(self):
+        self._verify_data()
         return self._cmds
 
     @cmds.setter
     def cmds(self, value):
         self._cmds = value
+        self.invalidate()
 
     def __init__(self, cmds=None, **kwargs):
         """ Script Image Constructor
@@ -379,30 +852,25 @@ class ScriptImage(BaseImage):
         self.header.image_type = EnumImageType.SCRIPT
         self._cmds = cmds if cmds else []
 
-    def __eq__(self, obj):
-        if not isinstance(obj, ScriptImage):
-            return False
-        if self.__len__() != len(obj):
-            return False
-        if self.cmds != obj.cmds:
-            return False
-        return True
-
     def __len__(self):
         return len(self._cmds)
 
     def __iter__(self):
+        self._verify_data()
         return iter(self._cmds)
 
     def __getitem__(self, key):
+        self._verify_data()
         return self._cmds[key]
 
     def __setitem__(self, key, value):
+        self._verify_data()
         self._cmds[key] = value
+        self.invalidate()
 
-    def info(self):
+    def _info(self):
         i = 0
-        msg  = super().info()
+        msg  = super()._info()
         msg += 'Content:       {0:d} Commands\n'.format(len(self._cmds))
         for cmd in self._cmds:
             msg += "{0:3d}) {1:s} {2:s}\n".format(i, cmd[0], cmd[1])
@@ -413,13 +881,17 @@ class ScriptImage(BaseImage):
         assert isinstance(cmd_name, str), "ScriptImage: Command name must be a string"
         assert isinstance(cmd_value, str), "ScriptImage: Command value must be a string"
         self._cmds.append([cmd_name, cmd_value])
+        self.invalidate()
 
     def pop(self, index):
         assert 0 <= index < len(self._cmds)
+        self._verify_data()
+        self.invalidate()
         return self._cmds.pop(index)
 
     def clear(self):
         self._cmds.clear()
+        self.invalidate()
 
     def load(self, txt_data):
 
@@ -433,12 +905,14 @@ class ScriptImage(BaseImage):
             if len(cmd) == 1:
                 cmd.append('')
             self._cmds.append([cmd[0], cmd[1]])
+        self.invalidate()
 
     def store(self, txt_data=None):
         """ Store variables into text file
         :param txt_data:
         :return: txt_data
         """
+        self._verify_data()
         if txt_data is None:
             txt_data = ""
 
@@ -448,36 +922,42 @@ class ScriptImage(BaseImage):
 
         return txt_data
 
-    def export(self):
-        """ Export the image into byte array. """
+    def _payload(self):
+        """ Get the image data (without header) """
+        self._verify_data()
         if len(self._cmds) == 0:
             raise Exception("Image: No data to export !")
 
         data = b''
         for cmd in self._cmds:
             data += "{0:s} {1:s}\n".format(cmd[0], cmd[1]).encode('utf-8')
-        data = pack('!2L', len(data), 0) + data
+        return pack('!2L', len(data), 0) + data
 
-        self.header.data_size = len(data)
-        self.header.data_crc = CRC32(data)
+    def _iter_payload(self, chunk_size=CHUNK_SIZE, keep=True):
+        yield self._payload()
 
-        return self.header.export() + data
+    def _export(self):
+        return self.header.export() + self._payload()
 
     @classmethod
-    def parse(cls, data, offset=0, ignore_crc=False):
+    def parse(cls, data, offset=0, ignore_crc=False, defer_crc=False):
         """ Load the image from byte array.
             :param data:   The raw image as byte array
             :param offset: The offset of input data
             :param ignore_crc: ignore crc errors
+            :param defer_crc: Check the data CRC at first access of commands (the header CRC is checked immediately)
         """
         img = cls()
         img.header = Header.parse(data, offset, ignore_crc)
         offset += img.header.size
-        if len(data[offset:]) < img.header.data_size:
+        if (len(data) - offset) < img.header.data_size:
             raise Exception("Image: Too small size of input data !")
 
-        data = data[offset:offset + img.header.data_size]
-        if CRC32(data) != img.header.data_crc:
+        data = memoryview(data)[offset:offset + img.header.data_size]
+        if defer_crc:
+            if not ignore_crc:
+                img._pending_crc = (data, img.header.data_crc)
+        elif CRC32(data) != img.header.data_crc:
             if not ignore_crc:
                 raise Exception("Image: Uncorrect CRC of input data ")
 
@@ -485,7 +965,7 @@ class ScriptImage(BaseImage):
         size = unpack_from('!2L', data)[0]
         offset = 8
 
-        data = data[offset:offset+size].decode('utf-8')
+        data = str(data[offset:offset+size], 'utf-8')
         for line in data.split('\n'):
             line = line.rstrip('\0')
             if not line:
@@ -500,10 +980,14 @@ class ScriptImage(BaseImage):
         return img
 
 
+# Reference to not yet parsed image inside lazy parsed MultiImage
+_ImgRef = namedtuple('_ImgRef', ['data', 'offset', 'ignore_crc'])
+
+
 class MultiImage(BaseImage):
     def __init__(self, imgs=None, **kwargs):
         """ Multi Image Constructor
-        :param imgs:     The list of all images
+        :param imgs:     The list of all images, the image data can be also FileData (file path, offset, size)
         :param laddr:    Load address
         :param eaddr:    Entry point address
         :param arch:     Architecture (ARCHType Enum)
@@ -516,103 +1000,189 @@ class MultiImage(BaseImage):
         self.header.image_type = EnumImageType.MULTI
         self._imgs = imgs if imgs else []
 
-    def __eq__(self, obj):
-        if not isinstance(obj, MultiImage):
-            return False
-        if self.__len__() != len(obj):
-            return False
-        for img in self._imgs:
-            if img not in obj:
-                return False
-        return True
-
     def __len__(self):
         return len(self._imgs)
 
     def __iadd__(self, value):
         self._imgs += value
+        self.invalidate()
+        return self
 
     def __iter__(self):
-        return iter(self._imgs)
+        # The data CRC of lazy parsed images is checked at first access of their data
+        return (self._resolve(i) for i in range(len(self._imgs)))
 
     def __getitem__(self, key):
-        return self._imgs[key]
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self._imgs)))]
+        img = self._resolve(key)
+        img._verify_data()
+        return img
+
+    def _resolve(self, index):
+        """ Get the image, the lazy parsed image is parsed at first access (only its header is checked) """
+        img = self._imgs[index]
+        if isinstance(img, _ImgRef):
+            (img_type,) = unpack_from('B', img.data, img.offset + 30)
+            img = _parse_img_type(img_type, img.data, img.offset, img.ignore_crc, True, defer_crc=True)
+            self._imgs[index] = img
+        return img
 
     def __setitem__(self, key, value):
         self._imgs[key] = value
+        self.invalidate()
 
     def __delitem__(self, key):
         self._imgs.remove(key)
+        self.invalidate()
 
-    def info(self):
-        msg  = super().info()
+    def _info(self):
+        msg  = super()._info()
         msg += 'Content:       {0:d} Images\n'.format(len(self._imgs))
         n = 0
-        for img in self._imgs:
+        for img in self:
+            # The headers of images were updated with the multi image header
             msg += '#IMAGE[' + str(n) + ']\n'
-            msg += img.info()
+            msg += img._info()
             n += 1
         return msg
 
     def append(self, image):
         assert isinstance(image, BaseImage), "MultiImage: Unsupported value"
         self._imgs.append(image)
+        self.invalidate()
 
     def pop(self, index):
         assert 0 <= index < len(self._imgs)
-        return self._imgs.pop(index)
+        # The lazy parsed image isn't verified, its data CRC is checked at first access of data
+        img = self._resolve(index)
+        self._imgs.pop(index)
+        self.invalidate()
+        return img
 
     def cear(self):
         self._imgs.clear()
-
-    def export(self):
-        """ Export the image into byte array.
-            :return
-        """
-        data = bytes()
+        self.invalidate()
+
+    def _state(self):
+        # The images are part of content, including their headers
+        states = tuple((img._state(), img.header.export()) for img in self)
+        if any(state is None for state, _ in states):
+            return None
+        return self._gen, states
+
+    def _data_fingerprint(self):
+        # Composed from fingerprints of images, so the time stamps of images are ignored too
+        return tuple(img.fingerprint() for img in self)
+
+    @staticmethod
+    def _padding(size):
+        """ Get the padding of image to 4-bytes boundary """
+        return -size % 4
+
+    def _table(self):
+        """ Get the table of images lengths, the headers of images must be updated before """
         dlen = []
-
-        if len(self._imgs) == 0:
-            raise Exception("MultiImage: No data to export !")
-
-        for img in self._imgs:
-            dimg = img.export()
-            # images must be aligned
-            if len(dimg) % 4:
-                dimg += b'\0' * (len(dimg) % 4)
-            dlen.append(len(dimg))
-            data += dimg
-
+        for img in self:
+            size = img.header.size + img.header.data_size
+            dlen.append(size + self._padding(size))
         dlen.append(0)
         fmt = "!{0:d}L".format(len(dlen))
-        data = pack(fmt, *dlen) + data
+        return pack(fmt, *dlen)
 
-        self.header.data_size = len(data)
-        self.header.data_crc = CRC32(data)
+    def _iter_payload(self, chunk_size=CHUNK_SIZE, keep=True):
+        yield self._table()
+        for img in self:
+            yield img.header.export()
+            yield from img._iter_payload(chunk_size, keep)
+            # images must be aligned
+            padding = self._padding(img.header.size + img.header.data_size)
+            if padding:
+                count_alloc('MultiImage.padding', padding)
+                yield bytes(padding)
 
-        return self.header.export() + data
+    def _update_images(self, workers=None):
+        """ Update the headers of all images, concurrently if workers is defined """
+        if len(self._imgs) == 0:
+            raise Exception("MultiImage: No data to export !")
+
+        if workers:
+            with get_executor(workers) as executor:
+                for future in [executor.submit(pool_task, img._update_header) for img in self]:
+                    future.result()
+        else:
+            for img in self:
+                img._update_header()
+
+    def _calc_crc(self):
+        # Composed from cached CRCs of images, so only the modified images are hashed again
+        table = self._table()
+        size, crc = len(table), zlib.crc32(table)
+        for img in self:
+            header = img.header.export()
+            padding = self._padding(img.header.size + img.header.data_size)
+            crc = zlib.crc32(header, crc)
+            crc = crc32_combine(crc, img.header.data_crc, img.header.data_size)
+            crc = zlib.crc32(bytes(padding), crc)
+            size += len(header) + img.header.data_size + padding
+        return size, crc & 0xFFFFFFFF
+
+    def _update_header(self, workers=None):
+        """ Update the headers of images (concurrently if workers is defined) and the header of multi image """
+        self._update_images(workers)
+        super()._update_header()
+
+    def _export(self):
+        chunks = [self.header.export()] + list(self._iter_payload())
+        count_copy('MultiImage.export', sum(len(chunk) for chunk in chunks))
+        return b''.join(chunks)
+
+    def export(self, workers=None):
+        """ Export the image into byte array.
+            :param workers: The number of threads (or shared Executor) for concurrent update of images
+            :return
+        """
+        # The images are updated only once, the shared mutable data aren't cached
+        self._update_header(workers)
+        return self._export_cached()
+
+    def export_to(self, fileobj, chunk_size=CHUNK_SIZE, workers=None):
+        """ Export the image into file object, the images are streamed one by one.
+            The table of images lengths is calculated first, so the data of every image are read twice:
+            for calculation of its CRC and for writing.
+            :param fileobj: The seekable file object opened for binary writing
+            :param chunk_size: The max size of data chunks read from input files
+            :param workers: The number of threads (or shared Executor) for concurrent update of images
+        """
+        self._update_images(workers)
+        super().export_to(fileobj, chunk_size)
 
     @classmethod
-    def parse(cls, data, offset=0, ignore_crc=False):
+    def parse(cls, data, offset=0, ignore_crc=False, lazy=False, workers=None):
         """ Load the image from byte array.
             :param data:   The raw image as byte array
             :param offset: The offset of input data
             :param ignore_crc: ignore crc errors
+            :param lazy: Build only the index of images, every image is parsed at first access. The data CRC of image
+                         is checked by __getitem__ or at first access of its data (so the iteration over headers
+                         doesn't read the data). The CRC of whole multi image isn't checked in this mode.
+            :param workers: The number of threads (or shared Executor) for concurrent CRC check and parsing of images
         """
         img = cls()
         img.header = Header.parse(data, offset, ignore_crc)
         offset += img.header.size
 
-        if len(data[offset:]) < img.header.data_size:
+        if (len(data) - offset) < img.header.data_size:
             raise Exception("MultiImage: Too small size of input data !")
 
-        if CRC32(data[offset:offset + img.header.data_size]) != img.header.data_crc:
-            if not ignore_crc:
-                raise Exception("MultiImage: Uncorrect CRC of input data !")
-
         if img.header.image_type != EnumImageType.MULTI:
             raise Exception("MultiImage: Not a Multi Image Type !")
 
+        payload = memoryview(data)[offset:offset + img.header.data_size]
+        if not (lazy or workers) and CRC32(payload) != img.header.data_crc:
+            if not ignore_crc:
+                raise Exception("MultiImage: Uncorrect CRC of input data !")
+
         # Parse images lengths
         sList = []
         while True:
@@ -621,11 +1191,28 @@ class MultiImage(BaseImage):
             if length == 0: break
             sList.append(length)
 
-        # Parse images itself
+        offsets = []
         for size in sList:
-            img.append(parse_img(data, offset))
+            offsets.append(offset)
             offset += size
 
+        # Parse images itself
+        if lazy:
+            for offset in offsets:
+                img._imgs.append(_ImgRef(data, offset, ignore_crc))
+        elif workers:
+            with get_executor(workers) as executor:
+                data_crc = executor.submit(pool_task, CRC32, payload)
+                imgs = [executor.submit(pool_task, parse_img, data, offset) for offset in offsets]
+                if data_crc.result() != img.header.data_crc:
+                    if not ignore_crc:
+                        raise Exception("MultiImage: Uncorrect CRC of input data !")
+                for future in imgs:
+                    img.append(future.result())
+        else:
+            for offset in offsets:
+                img.append(parse_img(data, offset))
+
         return img
 # ----------------------------------------------------------------------------------------------------------------------
 
@@ -636,20 +1223,19 @@ def get_img_type(data, offset=0, ignore_crc=False):
     :param offset: The offset
     :return: Image type and offset where image start
     """
+    start = offset
     while True:
-        if (offset + Header.SIZE) > len(data):
-            raise Exception(f"Not an U-Boot image ! {(offset + Header.SIZE)} > {len(data)}")
-
-        (header_mn, header_crc,) = unpack_from('!2L', data, offset)
-        # Check the magic number if is U-Boot image
-        if header_mn == Header.MAGIC_NUMBER:
-            header = bytearray(data[offset:offset+Header.SIZE])
-            header[4:8] = [0]*4
-            if not ignore_crc:
-                if header_crc == CRC32(header):
-                    break
-            else:
-                break
+        offset = find_bytes(data, Header.MAGIC_BYTES, offset)
+        if offset < 0 or (offset + Header.SIZE) > len(data):
+            raise Exception("Not an U-Boot image !")
+
+        # The header is expected on 4-bytes boundary from start offset
+        if (offset - start) % 4:
+            offset += 4 - ((offset - start) % 4)
+            continue
+
+        if ignore_crc or Header.check_crc(data, offset):
+            break
         offset += 4
 
     (image_type,) = unpack_from('B', data, offset + 30)
@@ -657,9 +1243,94 @@ def get_img_type(data, offset=0, ignore_crc=False):
     return image_type, offset
 
 
+ScanResult = namedtuple('ScanResult', ['offset', 'header', 'header_crc_ok', 'data_crc_ok'])
+
+
+def scan_images(data, offset=0, end=None, ignore_crc=False, check_data=True):
+    """ Help function for searching all images inside raw data (flash dumps, etc.)
+    :param data: The raw data as bytes, bytearray, memoryview or mmap
+    :param offset: The offset where the scan starts
+    :param end: The offset where the scan ends, header must start before it (default: end of data)
+    :param ignore_crc: Report also headers with invalid CRC
+    :param check_data: Check the CRC of image data
+    :return: Iterator of ScanResult(offset, header, header_crc_ok, data_crc_ok) ordered by offset
+    """
+    view = memoryview(data)
+    end = len(data) if end is None else min(end, len(data))
+    while True:
+        offset = find_bytes(data, Header.MAGIC_BYTES, offset, end + len(Header.MAGIC_BYTES) - 1)
+        if offset < 0 or (offset + Header.SIZE) > len(data):
+            return
+
+        header_crc_ok = Header.check_crc(view, offset)
+        if header_crc_ok or ignore_crc:
+            try:
+                header = Header.parse(view, offset, ignore_crc=True)
+            except Exception:
+                header = None
+            if header is not None:
+                data_crc_ok = None
+                if check_data:
+                    data_offset = offset + header.size
+                    data_crc_ok = (len(data) - data_offset) >= header.data_size and \
+                                  CRC32(view[data_offset:data_offset + header.data_size]) == header.data_crc
+                yield ScanResult(offset, header, header_crc_ok, data_crc_ok)
+
+        offset += len(Header.MAGIC_BYTES)
+
+
+def _scan_shard(args):
+    """ Scan one shard of memory mapped file (the process pool worker of scan_file) """
+    file, start, end, ignore_crc, check_data = args
+    with open(file, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return list(scan_images(data, start, end, ignore_crc, check_data))
+    finally:
+        data.close()
+
+
+def scan_file(file, offset=0, ignore_crc=False, check_data=True, workers=None, shard_size=None):
+    """ Help function for searching all images inside a large file in parallel
+    :param file: Path to the file (flash dump, etc.)
+    :param offset: The offset where the scan starts
+    :param ignore_crc: Report also headers with invalid CRC
+    :param check_data: Check the CRC of image data
+    :param workers: The number of worker processes (default: CPU count)
+    :param shard_size: The size of one shard in bytes (default: derived from file size and workers)
+    :return: List of ScanResult(offset, header, header_crc_ok, data_crc_ok) ordered by offset
+    """
+    size = os.path.getsize(file)
+    if size <= offset:
+        return []
+
+    workers = workers if workers else os.cpu_count() or 1
+    if shard_size is None:
+        shard_size = max(-(-(size - offset) // (workers * 4)), 16 * 1024 * 1024)
+
+    # Every shard reports headers starting inside its own range, but it reads the data behind its end,
+    # so the overlap between shards is always at least Header.SIZE and no header is missed on a boundary.
+    shards = [(file, start, min(start + shard_size, size), ignore_crc, check_data)
+              for start in range(offset, size, shard_size)]
+
+    if workers == 1 or len(shards) == 1:
+        results = map(_scan_shard, shards)
+        return [item for items in results for item in items]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # The CRC of image data isn't split into threads inside the worker processes
+        results = executor.map(pool_task, [_scan_shard] * len(shards), shards)
+        return [item for items in results for item in items]
+
+
 def new_img(**kwargs):
     """ Help function for creating image
     :param img_type:
+    :param compress: The compression type or 'auto' for selecting the best codec by measurement (see select_codec),
+                     the data are compressed by selected codec and the report is saved into compress_report attribute
+    :param policy: The selection policy for 'auto' compression (default: 'size')
+    :param read_speed: The read speed of boot media in bytes per second for 'speed' policy
+    :param workers: The number of worker processes for 'auto' compression (default: CPU count)
     :return: Image object
     """
     if not 'image' in kwargs:
@@ -673,6 +1344,23 @@ def new_img(**kwargs):
     if img_type not in EnumImageType:
         raise Exception("Not a valid image type")
 
+    report = None
+    if kwargs.get('compress') == 'auto':
+        if img_type in (EnumImageType.MULTI, EnumImageType.SCRIPT):
+            raise Exception("Auto compression is supported for data images only !")
+        if not kwargs.get('data'):
+            raise Exception("Auto compression requires the image data !")
+        report = select_codec(kwargs['data'],
+                              kwargs.pop('policy', 'size'),
+                              kwargs.pop('read_speed', READ_SPEED),
+                              workers=kwargs.pop('workers', None))
+        if report.data is None:
+            # The data over memory budget are compressed on the fly during export
+            kwargs['data'] = iter_compress(kwargs['data'], report.comp_type)
+        else:
+            kwargs['data'] = report.data
+        kwargs['compress'] = report.comp_type
+
     if img_type == EnumImageType.MULTI:
         img_obj = MultiImage(**kwargs)
     elif img_type == EnumImageType.FIRMWARE:
@@ -682,29 +1370,112 @@ def new_img(**kwargs):
     else:
         img_obj = StdImage(**kwargs)
 
+    if report is not None:
+        img_obj.compress_report = report
+
     return img_obj
 
 
-def parse_img(data, offset=0, ignore_crc=False):
+@traced('parse')
+def parse_img(data, offset=0, ignore_crc=False, lazy=False, workers=None):
     """ Help function for extracting image fom raw data
-    :param data: The raw data as byte array
+    :param data: The raw data as bytes, bytearray, memoryview or mmap (the last two are parsed without copying)
     :param offset: The offset
     :param ignore_crc: Ignore CRC mismatches
+    :param lazy: Parse the images inside multi image at first access (see MultiImage.parse)
+    :param workers: The number of threads (or shared Executor) for parsing of multi image (see MultiImage.parse)
+    :return: Image object
+    """
+    (img_type, offset) = get_img_type(data, offset, ignore_crc)
+
+    return _parse_img_type(img_type, data, offset, ignore_crc, lazy, workers)
+
+
+def parse_img_at(data, offset=0, ignore_crc=False, lazy=False, workers=None):
+    """ Help function for parsing the image at exact offset, the next valid header isn't searched
+    :param data: The raw data as bytes, bytearray, memoryview or mmap (the last two are parsed without copying)
+    :param offset: The offset of image header
+    :param ignore_crc: Ignore CRC mismatches
+    :param lazy: Parse the images inside multi image at first access (see MultiImage.parse)
+    :param workers: The number of threads (or shared Executor) for parsing of multi image (see MultiImage.parse)
     :return: Image object
     """
-    (img_type, offset) = get_img_type(bytearray(data), offset, ignore_crc)
+    if len(data) - offset < Header.SIZE:
+        raise Exception("Image: Too small size of input data !")
+    (img_type,) = unpack_from('B', data, offset + 30)
+
+    return _parse_img_type(img_type, data, offset, ignore_crc, lazy, workers)
 
+
+def _parse_img_type(img_type, data, offset, ignore_crc, lazy, workers=None, defer_crc=False):
+    """ Parse the image of known type at exact offset, the data CRC of standard and script images can be deferred """
     if img_type not in EnumImageType:
         raise Exception("Not a valid image type")
 
     if img_type == EnumImageType.MULTI:
-        img = MultiImage.parse(data, offset, ignore_crc)
+        img = MultiImage.parse(data, offset, ignore_crc, lazy, workers)
     elif img_type == EnumImageType.FIRMWARE:
-        img = FwImage.parse(data, offset, ignore_crc)
+        img = FwImage.parse(data, offset, ignore_crc, defer_crc)
     elif img_type == EnumImageType.SCRIPT:
-        img = ScriptImage.parse(data, offset, ignore_crc)
+        img = ScriptImage.parse(data, offset, ignore_crc, defer_crc)
     else:
-        img = StdImage.parse(data, offset, ignore_crc)
+        img = StdImage.parse(data, offset, ignore_crc, defer_crc)
         img.header.image_type = img_type
 
     return img
+
+
+def parse_img_file(file, offset=0, ignore_crc=False, lazy=False, workers=None):
+    """ Help function for extracting image from file without loading it into memory
+    :param file: Path to image file
+    :param offset: The offset
+    :param ignore_crc: Ignore CRC mismatches
+    :param lazy: Parse the images inside multi image at first access (see MultiImage.parse)
+    :param workers: The number of threads (or shared Executor) for parsing of multi image (see MultiImage.parse)
+    :return: Image object, its data are read-only views over the memory mapped file
+    """
+    if os.path.getsize(file) == 0:
+        raise Exception("Not an U-Boot image ! Empty file: %s" % file)
+
+    with span('read'), open(file, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return parse_img(data, offset, ignore_crc, lazy, workers)
+
+
+def patch_img_file(file, offset=0, patches=(), ignore_crc=False, **kwargs):
+    """ Help function for patching the image file in place, only the header and the patched ranges are written.
+        The data CRC is updated from the patched ranges, so the unchanged data are not read at all.
+    :param file: Path to image file
+    :param offset: The offset of image inside file
+    :param patches: The list of (offset, bytes) replacing the ranges of image data (not supported for multi image)
+    :param ignore_crc: Ignore the CRC mismatch of original header
+    :param kwargs: The header fields: laddr, eaddr, arch, os, image, compress, name, time (see Header.update)
+    :return: The updated Header object
+    """
+    with open(file, 'r+b') as f:
+        f.seek(offset)
+        header = Header.parse(f.read(Header.SIZE), 0, ignore_crc)
+        header.update(**kwargs)
+
+        if patches and header.image_type == EnumImageType.MULTI:
+            raise Exception("Image: The data of multi image can't be patched, patch the sub-image !")
+
+        for data_offset, data in patches:
+            if data_offset < 0 or data_offset + len(data) > header.data_size:
+                raise Exception("Image: Patch out of data range !")
+
+        for data_offset, data in patches:
+            with span('read', len(data)):
+                f.seek(offset + Header.SIZE + data_offset)
+                old = f.read(len(data))
+            header.data_crc = crc32_patch(header.data_crc, old, data, header.data_size - data_offset - len(data))
+            with span('write', len(data)):
+                f.seek(offset + Header.SIZE + data_offset)
+                f.write(data)
+
+        with span('write', Header.SIZE):
+            f.seek(offset)
+            f.write(header.export())
+
+    return header
@@ -0,0 +1,275 @@
+# Copyright 2018 Martin Olejar
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import time
+import functools
+import threading
+from collections import OrderedDict
+
+# The processing stages used inside library
+STAGES = ('read', 'parse', 'checksum', 'compress', 'decompress', 'serialize', 'write')
+
+# The registered sinks: callable(stage, elapsed, size), the elapsed time excludes the nested spans
+_sinks = []
+_local = threading.local()
+
+# The registered copy counters (debug mode): callable(kind, site, size)
+_counters = []
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Spans
+# ----------------------------------------------------------------------------------------------------------------------
+class Span(object):
+    """ Timing span of a processing stage, it's measured only if some sink is registered """
+
+    __slots__ = ('stage', 'size', '_start', '_nested')
+
+    def __init__(self, stage, size=None):
+        """ Span Constructor
+        :param stage: The name of stage (read, parse, checksum, serialize, write, ...)
+        :param size: The size of processed data in bytes (optional)
+        """
+        self.stage = stage
+        self.size = size
+        self._start = None
+        self._nested = 0.0
+
+    def __enter__(self):
+        if _sinks:
+            stack = getattr(_local, 'stack', None)
+            if stack is None:
+                stack = _local.stack = []
+            stack.append(self)
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._start is None:
+            return False
+
+        elapsed = time.perf_counter() - self._start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            # The parent span reports its own time only
+            stack[-1]._nested += elapsed
+        for sink in list(_sinks):
+            sink(self.stage, elapsed - self._nested, self.size)
+        return False
+
+
+def span(stage, size=None):
+    """ Help function for timing a block of code: with span('write', len(data)): ...
+    :param stage: The name of stage
+    :param size: The size of processed data in bytes (optional)
+    :return: Span object (context manager)
+    """
+    return Span(stage, size)
+
+
+def traced(stage):
+    """ Decorator for timing the function calls as a stage
+    :param stage: The name of stage
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return func(*args, **kwargs)
+            with Span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_sink(sink):
+    """ Register the sink of spans
+    :param sink: The callable(stage, elapsed, size) called at the end of every span
+    """
+    _sinks.append(sink)
+
+
+def remove_sink(sink):
+    """ Unregister the sink of spans
+    :param sink: The registered sink
+    """
+    _sinks.remove(sink)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Profile
+# ----------------------------------------------------------------------------------------------------------------------
+class Profile(object):
+    """ The sink collecting the time of stages, use it as context manager: with Profile() as prof: ... """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        # The spans can be reported from worker threads
+        self._lock = threading.Lock()
+
+    def __call__(self, stage, elapsed, size):
+        with self._lock:
+            item = self.stages.setdefault(stage, {'calls': 0, 'time': 0.0, 'bytes': 0})
+            item['calls'] += 1
+            item['time'] += elapsed
+            if size:
+                item['bytes'] += size
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def __str__(self):
+        return self.info()
+
+    def __repr__(self):
+        return self.info()
+
+    @property
+    def total(self):
+        return sum(item['time'] for item in self.stages.values())
+
+    def start(self):
+        """ Start collecting of spans """
+        add_sink(self)
+
+    def stop(self):
+        """ Stop collecting of spans """
+        if self in _sinks:
+            remove_sink(self)
+
+    def info(self):
+        """ Get the table of stages
+        :return string
+        """
+        total = self.total
+        msg = " {0:<12s} {1:>8s} {2:>10s} {3:>7s} {4:>10s} {5:>10s}\n".format(
+            "Stage", "Calls", "Time [s]", "Share", "Size [MB]", "MB/s")
+        for stage, item in sorted(self.stages.items(), key=lambda x: -x[1]['time']):
+            size = item['bytes'] / 1024 / 1024
+            msg += " {0:<12s} {1:>8d} {2:>10.4f} {3:>6.1f}% {4:>10.2f} {5:>10s}\n".format(
+                stage, item['calls'], item['time'], 100 * item['time'] / total if total else 0, size,
+                "{:.1f}".format(size / item['time']) if item['bytes'] and item['time'] else "-")
+        msg += " {0:<12s} {1:>8s} {2:>10.4f}\n".format("Total", "", total)
+        return msg
+
+    def to_dict(self):
+        """ Get the stages as dictionary (JSON serializable) """
+        return {'total': self.total, 'stages': self.stages}
+
+    def save(self, file):
+        """ Save the stages into JSON file
+        :param file: Path to file
+        """
+        with open(file, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Copy Accounting
+# ----------------------------------------------------------------------------------------------------------------------
+def count_copy(site, size):
+    """ Record the copy of data made inside library (no-op if no counter is active)
+    :param site: The place of copy (e.g. 'StdImage.export')
+    :param size: The size of copied data in bytes
+    """
+    for counter in list(_counters):
+        counter('copy', site, size)
+
+
+def count_alloc(site, size):
+    """ Record the allocation of new buffer inside library (no-op if no counter is active)
+    :param site: The place of allocation (e.g. 'MultiImage.padding')
+    :param size: The size of allocated buffer in bytes
+    """
+    for counter in list(_counters):
+        counter('alloc', site, size)
+
+
+class CopyCounter(object):
+    """ Debug counter of bytes copied and allocated by library in the hot paths (slicing, concatenation, conversion
+        of views into bytes, ...), use it as context manager:
+
+        with CopyCounter() as counter:
+            parse_img_file(file)
+        counter.check(max_copied=0)
+    """
+
+    def __init__(self):
+        self.copied = 0
+        self.allocated = 0
+        # site -> {'copy': bytes, 'alloc': bytes, 'calls': count}
+        self.sites = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, kind, site, size):
+        with self._lock:
+            item = self.sites.setdefault(site, {'copy': 0, 'alloc': 0, 'calls': 0})
+            item[kind] += size
+            item['calls'] += 1
+            if kind == 'copy':
+                self.copied += size
+            else:
+                self.allocated += size
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def __str__(self):
+        return self.info()
+
+    def __repr__(self):
+        return self.info()
+
+    def start(self):
+        """ Start counting """
+        _counters.append(self)
+
+    def stop(self):
+        """ Stop counting """
+        if self in _counters:
+            _counters.remove(self)
+
+    def check(self, max_copied=None, max_allocated=None):
+        """ Check the byte budget
+        :param max_copied: The max number of copied bytes (None = not checked)
+        :param max_allocated: The max number of allocated bytes (None = not checked)
+        """
+        if max_copied is not None and self.copied > max_copied:
+            raise Exception("CopyCounter: Copied %d bytes, budget is %d bytes !\n%s" %
+                            (self.copied, max_copied, self.info()))
+        if max_allocated is not None and self.allocated > max_allocated:
+            raise Exception("CopyCounter: Allocated %d bytes, budget is %d bytes !\n%s" %
+                            (self.allocated, max_allocated, self.info()))
+
+    def info(self):
+        """ Get the table of sites
+        :return string
+        """
+        msg = " {0:<28s} {1:>8s} {2:>14s} {3:>14s}\n".format("Site", "Calls", "Copied [B]", "Allocated [B]")
+        for site, item in self.sites.items():
+            msg += " {0:<28s} {1:>8d} {2:>14d} {3:>14d}\n".format(site, item['calls'], item['copy'], item['alloc'])
+        msg += " {0:<28s} {1:>8s} {2:>14d} {3:>14d}\n".format("Total", "", self.copied, self.allocated)
+        return msg